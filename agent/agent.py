@@ -3,13 +3,28 @@ import asyncio
 import time
 import sys
 import os
+import json
 import requests
-import base64
 from typing import Dict, Any, Optional
 from dataclasses import dataclass, field
 from langgraph.graph import StateGraph, END
-import cv2
-from server import webrtc_capture_frame
+from dotenv import load_dotenv
+from frame_receiver import webrtc_capture_frame, read_receive_stats
+from metrics_store import MetricsStore
+from supervisor import StageSupervisor, TickSkipped
+from sampling_governor import SamplingGovernor
+from escalation import build_escalation_payload_async
+
+# Seconds between monitoring ticks, and the latency budget for one tick of each stage.
+# The attention budget covers a Gemini escalation round trip.
+MONITOR_INTERVAL = 0.5
+STAGE_DEADLINES = {"posture": 2.0, "attention": 10.0}
+SAMPLING_UPDATE_INTERVAL = 1.0
+# The server rewrites its receive stats every few seconds
+INGEST_STATS_INTERVAL = 5.0
+GEMINI_TIMEOUT = 8.0
+
+load_dotenv()
 
 @dataclass
 class PostureState:
@@ -22,7 +37,9 @@ class PostureState:
     phone_notification_shown: bool = False
     last_posture_result: Optional[Dict[str, Any]] = None
     last_face_angle_result: Optional[Dict[str, Any]] = None
-    monitor_task: Optional[asyncio.Task] = None
+    supervisor: Optional[StageSupervisor] = None
+    metrics_store: Optional[MetricsStore] = None
+    governor: Optional[SamplingGovernor] = None
     camera_working: bool = False
 
 graph = StateGraph(PostureState)
@@ -64,7 +81,16 @@ async def calibrate(state: PostureState):
         print("⚠️ Skipping calibration due to camera issues.")
         return state
     
-    from posture_tools import calibrate_posture_tool, calibrate_face_angle_tool
+    from posture_tools import calibrate_posture_tool, calibrate_face_angle_tool, tune_pose_model_tool
+    
+    try:
+        # Pick the pose model before calibrating so the baseline comes from the same model
+        print("\n--- Pose Model Selection ---")
+        tune_result = await tune_pose_model_tool()
+        if tune_result["status"] != "success":
+            print(f"⚠️ Pose model selection failed, using defaults: {tune_result.get('error', 'Unknown error')}")
+    except Exception as e:
+        print(f"⚠️ Unexpected error during pose model selection: {str(e)}")
     
     try:
         print("\n--- Body Posture Calibration ---")
@@ -94,10 +120,122 @@ async def calibrate(state: PostureState):
     
     return state
 
-async def check_posture_and_attention(state: PostureState):
-    """Check posture and attention if at least one calibration succeeded."""
+async def record_metrics(state: PostureState, metrics):
+    """Append one metrics row, flushing in a worker thread when a chunk is due."""
+    if state.metrics_store and metrics:
+        try:
+            if state.metrics_store.append(**metrics):
+                await state.metrics_store.flush_async()
+        except Exception as e:
+            print(f"⚠️ Metrics write error: {str(e)}")
+
+def build_monitoring_stages(state: PostureState):
+    """Build the per-tick monitoring steps, keyed by stage name, for the calibrated checks."""
     from posture_tools import posture_check_tool, check_face_angle_tool
     
+    async def posture_stage():
+        metrics = {}
+        try:
+            started = time.perf_counter()
+            posture_result = await posture_check_tool()
+            if posture_result["status"] == "skipped":
+                raise TickSkipped(posture_result["error"])
+            metrics["posture_latency_ms"] = (time.perf_counter() - started) * 1000
+            if state.governor:
+                state.governor.observe_cost("posture", metrics["posture_latency_ms"])
+            if posture_result["status"] == "success":
+                metrics["deviation"] = posture_result["deviation"]
+                metrics["posture_good"] = posture_result["posture_good"]
+                if state.governor:
+                    state.governor.observe_posture(posture_result["deviation"], posture_result["threshold"])
+                state.last_posture_result = posture_result
+                bad_posture = not posture_result["posture_good"]
+                
+                if bad_posture and not state.posture_notification_shown:
+                    print(f"⚠️ Bad posture detected! Deviation: {posture_result['deviation']:.2f}")
+                    state.posture_notification_shown = True
+                    state.bad_posture_count += 1
+                elif not bad_posture and state.posture_notification_shown:
+                    print(f"✅ Posture corrected! Deviation: {posture_result['deviation']:.2f}")
+                    state.posture_notification_shown = False
+        except TickSkipped:
+            raise
+        except Exception as e:
+            print(f"⚠️ Posture check error: {str(e)}")
+        await record_metrics(state, metrics)
+    
+    async def escalate(face_result, metrics):
+        # Reuse the frame that was just analysed, cropped to face, hands and lap
+        payload = await build_escalation_payload_async(face_result["frame"], face_result.get("landmarks"))
+        started = time.perf_counter()
+        result = await ask_gemini_if_looking_at_phone(payload["image_base64"])
+        rtt_ms = (time.perf_counter() - started) * 1000
+        metrics.update(
+            escalation_bytes=payload["bytes"],
+            escalation_encode_ms=payload["encode_ms"],
+            escalation_rtt_ms=rtt_ms,
+        )
+        width, height = payload["size"]
+        print(f"📤 Escalation sent {payload['bytes'] / 1024:.1f} KB ({width}x{height}), encoded in {payload['encode_ms']:.1f} ms, answered in {rtt_ms:.0f} ms")
+        return result
+    
+    async def attention_stage():
+        metrics = {}
+        try:
+            started = time.perf_counter()
+            face_result = await check_face_angle_tool()
+            if face_result["status"] == "skipped":
+                raise TickSkipped(face_result["error"])
+            metrics["face_latency_ms"] = (time.perf_counter() - started) * 1000
+            if state.governor:
+                state.governor.observe_cost("attention", metrics["face_latency_ms"])
+            if face_result["status"] == "success":
+                state.last_face_angle_result = face_result
+                if state.governor:
+                    state.governor.observe_face(
+                        face_result["current_angles"]["vertical"],
+                        face_result["current_angles"]["horizontal"],
+                        face_result["looking_down"],
+                    )
+                metrics.update(
+                    vertical_angle=face_result["current_angles"]["vertical"],
+                    horizontal_angle=face_result["current_angles"]["horizontal"],
+                    vertical_deviation=face_result["vertical_deviation"],
+                    horizontal_deviation=face_result["horizontal_deviation"],
+                    looking_down=face_result["looking_down"],
+                    looking_away=face_result["looking_away"],
+                )
+                # Record before escalating so a slow Gemini call can't lose the sample
+                await record_metrics(state, metrics)
+                metrics = {}
+                looking_at_phone = face_result["looking_down"]
+                
+                if looking_at_phone != state.phone_notification_shown:
+                    result = await escalate(face_result, metrics)
+                    
+                    if looking_at_phone and result == "yes":
+                        print(f"📱 Suspicious! You appear to be looking down at your phone or device.")
+                        print(f"   Vertical deviation: {face_result['vertical_deviation']:.2f}°")
+                        state.phone_notification_shown = True
+                        state.phone_suspicion_count += 1
+                    elif not looking_at_phone and result == "no":
+                        print(f"✅ You're no longer looking down at your phone.")
+                        state.phone_notification_shown = False
+        except TickSkipped:
+            raise
+        except Exception as e:
+            print(f"⚠️ Face angle check error: {str(e)}")
+        await record_metrics(state, metrics)
+    
+    stages = {}
+    if state.posture_calibrated:
+        stages["posture"] = posture_stage
+    if state.face_angle_calibrated:
+        stages["attention"] = attention_stage
+    return stages
+
+async def check_posture_and_attention(state: PostureState):
+    """Check posture and attention if at least one calibration succeeded."""
     if not state.posture_calibrated and not state.face_angle_calibrated:
         print("\n❌ Error: At least one calibration (posture or face) must succeed to continue.")
         print("Please restart the application and try calibration again.")
@@ -113,67 +251,47 @@ async def check_posture_and_attention(state: PostureState):
     print(f"✅ Monitoring enabled for: {', '.join(features_checked)}")
     
     try:
-        async def continuous_monitoring():
-            while True:
-                try:
-                    if state.posture_calibrated:
-                        try:
-                            posture_result = await posture_check_tool()
-                            if posture_result["status"] == "success":
-                                state.last_posture_result = posture_result
-                                bad_posture = not posture_result["posture_good"]
-                                
-                                if bad_posture and not state.posture_notification_shown:
-                                    print(f"⚠️ Bad posture detected! Deviation: {posture_result['deviation']:.2f}")
-                                    state.posture_notification_shown = True
-                                    state.bad_posture_count += 1
-                                elif not bad_posture and state.posture_notification_shown:
-                                    print(f"✅ Posture corrected! Deviation: {posture_result['deviation']:.2f}")
-                                    state.posture_notification_shown = False
-                        except Exception as e:
-                            print(f"⚠️ Posture check error: {str(e)}")
-                    
-                    if state.face_angle_calibrated:
-                        try:
-                            face_result = await check_face_angle_tool()
-                            if face_result["status"] == "success":
-                                state.last_face_angle_result = face_result
-                                looking_at_phone = face_result["looking_down"]
-                                
-
-
-                                if looking_at_phone and not state.phone_notification_shown:
-                                    cap_res = await webrtc_capture_frame()
-                                    if cap_res["status"] == "success":
-                                        frame = cap_res["frame"]
-                                        result = await ask_gemini_if_looking_at_phone(frame)
-
-                                        if result == "yes":
-                                            print(f"📱 Suspicious! You appear to be looking down at your phone or device.")
-                                            print(f"   Vertical deviation: {face_result['vertical_deviation']:.2f}°")
-                                            state.phone_notification_shown = True
-                                            state.phone_suspicion_count += 1
-                                elif not looking_at_phone and state.phone_notification_shown:
-                                    cap_res = await webrtc_capture_frame()
-                                    if cap_res["status"] == "success":
-                                        frame = cap_res["frame"]
-                                        result = await ask_gemini_if_looking_at_phone(frame)
-
-                                        if result == "no":
-                                            print(f"✅ You're no longer looking down at your phone.")
-                                            state.phone_notification_shown = False
-                                    
-                        except Exception as e:
-                            print(f"⚠️ Face angle check error: {str(e)}")
-                            
-                except Exception as e:
-                    print(f"❌ Monitoring error: {str(e)}")
-                
-                await asyncio.sleep(0.5)
+        state.metrics_store = MetricsStore()
+    except Exception as e:
+        print(f"⚠️ Metrics store unavailable: {str(e)}")
+    
+    try:
+        # LangGraph hands main() a snapshot; the supervisor keeps the live state the stages update
+        supervisor = StageSupervisor(context=state)
+        stages = build_monitoring_stages(state)
+        for name, step in stages.items():
+            supervisor.add_stage(name, step, MONITOR_INTERVAL, STAGE_DEADLINES[name])
+        
+        state.governor = SamplingGovernor()
+        
+        async def sampling_stage():
+            governor = state.governor
+            controlled = governor.poll_control()
+            if governor.update() or controlled:
+                # The server forwards this line as the dashboard's 'sampling' event
+                print(f"⏱️ Sampling {json.dumps(governor.state())}")
+            for name in stages:
+                supervisor.set_interval(name, governor.interval)
         
-        monitor_task = asyncio.create_task(continuous_monitoring())
+        supervisor.add_stage("sampling", sampling_stage, SAMPLING_UPDATE_INTERVAL, SAMPLING_UPDATE_INTERVAL)
         
-        state.monitor_task = monitor_task
+        last_ingest = {}
+        
+        async def ingest_stage():
+            # Frame conversion happens in the server process; record its cost alongside the checks
+            stats = await asyncio.to_thread(read_receive_stats)
+            if not stats or stats.get("convert_ms_mean") is None or stats.get("written_at") == last_ingest.get("written_at"):
+                return
+            last_ingest.update(stats)
+            await record_metrics(state, {
+                "convert_ms_mean": stats.get("convert_ms_mean"),
+                "convert_ms_p95": stats.get("convert_ms_p95"),
+            })
+        
+        supervisor.add_stage("ingest", ingest_stage, INGEST_STATS_INTERVAL, INGEST_STATS_INTERVAL)
+        supervisor.start()
+        
+        state.supervisor = supervisor
         
     except Exception as e:
         print(f"❌ Error setting up monitoring: {str(e)}")
@@ -205,6 +323,9 @@ async def main():
         print("\n❌ Exiting due to failed calibration. Please try again.")
         return
     
+    supervisor = final_state.get("supervisor", None)
+    live_state = supervisor.context if supervisor else None
+    
     print("\n👀 Posture and attention monitoring is running in the background.")
     print("📊 Stats will be displayed when posture or attention changes.")
     print("📋 Press Ctrl+C to exit the monitoring system.\n")
@@ -212,28 +333,46 @@ async def main():
     try:
         while True:
             await asyncio.sleep(1)
-    except KeyboardInterrupt:
+    except (KeyboardInterrupt, asyncio.CancelledError):
         print("\n⏹️ Monitoring stopped by user.")
         print(f"📊 Session summary:")
         
+        metrics_store = final_state.get("metrics_store", None)
+        summary = metrics_store.summary() if metrics_store else None
+        
         if final_state.get("posture_calibrated", False):
-            print(f"   - Bad posture incidents: {final_state.bad_posture_count}")
+            print(f"   - Bad posture incidents: {live_state.bad_posture_count if live_state else 0}")
+            if summary:
+                print(f"   - Time in bad posture: {summary['time_in_bad_posture_s'] / 60:.1f} min")
         
         if final_state.get("face_angle_calibrated", False):
-            print(f"   - Phone usage suspicions: {final_state.phone_suspicion_count}")
+            print(f"   - Phone usage suspicions: {live_state.phone_suspicion_count if live_state else 0}")
+            if summary:
+                print(f"   - Time looking down: {summary['time_looking_down_s'] / 60:.1f} min")
+        
+        if summary and summary["convert_ms_mean"] is not None:
+            print(f"   - Frame conversion: {summary['convert_ms_mean']:.1f} ms mean")
+        
+        if metrics_store:
+            print(f"   - Metrics saved to {metrics_store.path}")
+        
+        if supervisor:
+            for name, stats in supervisor.stats().items():
+                if isinstance(stats, dict) and stats["p99_ms"] is not None:
+                    print(f"   - {name}: p99 {stats['p99_ms']:.0f} ms, {stats['overruns']} overruns, {stats['restarts']} restarts")
     finally:
-        if final_state.get("monitor_task", None):
-            final_state.get("monitor_task").cancel()
+        if supervisor:
+            await supervisor.stop()
+        if final_state.get("metrics_store", None):
+            final_state.get("metrics_store").close()
 
 
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GEMINI_URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={GEMINI_API_KEY}"
 
-async def ask_gemini_if_looking_at_phone(frame):
-    ret, buffer = cv2.imencode('.jpg', frame)
-    image_base64 = base64.b64encode(buffer).decode()
-
+async def ask_gemini_if_looking_at_phone(image_base64):
+    """Ask Gemini about a JPEG built by build_escalation_payload."""
     payload = {
         "contents": [
             {
@@ -250,7 +389,8 @@ async def ask_gemini_if_looking_at_phone(frame):
         ]
     }
 
-    response = requests.post(GEMINI_URL, json=payload)
+    # requests blocks, so keep it off the event loop where it would stall every stage
+    response = await asyncio.to_thread(requests.post, GEMINI_URL, json=payload, timeout=GEMINI_TIMEOUT)
     response.raise_for_status()
     data = response.json()
 
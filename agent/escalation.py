@@ -0,0 +1,76 @@
+# escalation.py
+import os
+import time
+import base64
+import asyncio
+import cv2
+
+ESCALATION_MAX_SIDE = int(os.getenv("ESCALATION_MAX_SIDE", "512"))
+ESCALATION_JPEG_QUALITY = int(os.getenv("ESCALATION_JPEG_QUALITY", "70"))
+
+# MediaPipe Pose landmark indices: 0-10 face, 11-22 shoulders, arms and hands, 23-24 hips
+REGION_LANDMARKS = range(0, 25)
+MIN_VISIBILITY = 0.3
+# Padding around the landmark box, as a fraction of its size, and how far below the
+# hips (as a fraction of frame height) to extend so a phone held in the lap is included
+CROP_PADDING = 0.15
+LAP_EXTENSION = 0.15
+
+
+def escalation_region(landmarks, width, height):
+    """Pixel box ``(x0, y0, x1, y1)`` covering face, hands and lap, or None if nothing is visible."""
+    if not landmarks:
+        return None
+    points = [landmarks[i] for i in REGION_LANDMARKS if i < len(landmarks) and getattr(landmarks[i], "visibility", 1.0) >= MIN_VISIBILITY]
+    if not points:
+        return None
+
+    xs = [p.x for p in points]
+    ys = [p.y for p in points]
+    x0, x1 = min(xs), max(xs)
+    y0, y1 = min(ys), max(ys)
+    pad_x = (x1 - x0) * CROP_PADDING
+    pad_y = (y1 - y0) * CROP_PADDING
+
+    x0 = int(max(0.0, x0 - pad_x) * width)
+    x1 = int(min(1.0, x1 + pad_x) * width)
+    y0 = int(max(0.0, y0 - pad_y) * height)
+    y1 = int(min(1.0, y1 + pad_y + LAP_EXTENSION) * height)
+    if x1 - x0 < 16 or y1 - y0 < 16:
+        return None
+    return x0, y0, x1, y1
+
+
+def build_escalation_payload(frame, landmarks=None, max_side=ESCALATION_MAX_SIDE, quality=ESCALATION_JPEG_QUALITY):
+    """Crop, downscale and JPEG-encode an analysed RGB frame for a remote vision check."""
+    started = time.perf_counter()
+    height, width = frame.shape[:2]
+
+    region = escalation_region(landmarks, width, height)
+    if region:
+        x0, y0, x1, y1 = region
+        image = frame[y0:y1, x0:x1]
+    else:
+        image = frame
+
+    scale = max_side / max(image.shape[:2])
+    if scale < 1:
+        image = cv2.resize(image, (int(image.shape[1] * scale), int(image.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+
+    # Analysis frames are RGB; OpenCV encodes BGR
+    ok, buffer = cv2.imencode('.jpg', cv2.cvtColor(image, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("JPEG encoding failed")
+
+    return {
+        "image_base64": base64.b64encode(buffer).decode(),
+        "bytes": len(buffer),
+        "encode_ms": (time.perf_counter() - started) * 1000,
+        "cropped": region is not None,
+        "size": (image.shape[1], image.shape[0]),
+    }
+
+
+async def build_escalation_payload_async(frame, landmarks=None, **kwargs):
+    """``build_escalation_payload`` in a worker thread, keeping encoding off the event loop."""
+    return await asyncio.to_thread(build_escalation_payload, frame, landmarks, **kwargs)
@@ -0,0 +1,187 @@
+# frame_receiver.py
+import os
+import json
+import time
+import asyncio
+from collections import deque
+import numpy as np
+
+# The server process receives WebRTC frames and hands the latest analysis frame
+# to the agent subprocess through these files.
+FRAMES_DIR = "frames"
+latest_frame_path = os.path.join(FRAMES_DIR, "latest_frame.npy")
+webrtc_status_path = os.path.join(FRAMES_DIR, "webrtc_ready")
+receive_stats_path = os.path.join(FRAMES_DIR, "receive_stats.json")
+# Written by the agent once it has picked a pose input width, so frames are
+# converted straight to that size instead of being resized again
+analysis_width_path = os.path.join(FRAMES_DIR, "analysis_width.json")
+
+ANALYSIS_FPS = float(os.getenv("ANALYSIS_FPS", "2"))
+ANALYSIS_WIDTH = int(os.getenv("ANALYSIS_WIDTH", "640"))
+
+
+class FrameReceiver:
+    """Keeps decoded ``av.VideoFrame`` objects and converts only the ones that get analysed.
+
+    Frames are decimated to ``analysis_fps`` and converted straight to an RGB
+    array no wider than ``analysis_width`` (the layout MediaPipe Pose takes), so
+    skipped frames never pay for a colour conversion. A narrower width the
+    agent publishes at ``width_path`` takes over until the file is removed.
+    """
+
+    def __init__(self, analysis_fps=ANALYSIS_FPS, analysis_width=ANALYSIS_WIDTH, output_path=latest_frame_path, stats_path=receive_stats_path, stats_interval=5.0,
+                 width_path=analysis_width_path):
+        self.analysis_fps = analysis_fps
+        self.analysis_width = analysis_width
+        self.default_width = analysis_width
+        self.width_path = width_path
+        self.output_path = output_path
+        self.stats_path = stats_path
+        self.stats_interval = stats_interval
+
+        self.latest_frame = None
+        self.latest_received_at = None
+        self.last_convert_ms = None
+        self.frames_received = 0
+        self.frames_converted = 0
+        self._last_publish = None
+        self._last_stats_write = time.monotonic()
+        self._convert_ms = deque(maxlen=256)
+        self._width_mtime = None
+
+    def submit(self, frame):
+        """Record a decoded frame. Returns True when it is due for analysis."""
+        now = time.monotonic()
+        self.latest_frame = frame
+        self.latest_received_at = now
+        self.frames_received += 1
+
+        if self.analysis_fps <= 0:
+            return True
+        if self._last_publish is None or now - self._last_publish >= 1.0 / self.analysis_fps:
+            self._last_publish = now
+            return True
+        return False
+
+    def convert(self, frame=None):
+        """Convert a frame (default: the latest) to an RGB ndarray at analysis resolution."""
+        frame = frame if frame is not None else self.latest_frame
+        if frame is None:
+            return None
+
+        self._poll_width()
+        started = time.perf_counter()
+        width, height = frame.width, frame.height
+        if self.analysis_width and width > self.analysis_width:
+            height = max(2, int(round(height * self.analysis_width / width / 2)) * 2)
+            width = self.analysis_width
+            rgb = frame.reformat(width=width, height=height, format="rgb24").to_ndarray()
+        else:
+            rgb = frame.to_ndarray(format="rgb24")
+        self.last_convert_ms = (time.perf_counter() - started) * 1000
+        self._convert_ms.append(self.last_convert_ms)
+        self.frames_converted += 1
+        return rgb
+
+    def _poll_width(self):
+        if not self.width_path:
+            return
+        try:
+            mtime = os.path.getmtime(self.width_path)
+        except OSError:
+            mtime = None
+        if mtime == self._width_mtime:
+            return
+        self._width_mtime = mtime
+
+        width = self.default_width
+        if mtime is not None:
+            try:
+                with open(self.width_path) as f:
+                    requested = int(json.load(f)["width"])
+                width = min(requested, self.default_width) if self.default_width else requested
+            except Exception as e:
+                print(f"⚠️ Ignoring analysis width: {e}")
+        self.analysis_width = width
+
+    def publish(self, frame=None):
+        """Convert and atomically write the analysis frame for the agent process.
+
+        Returns the converted RGB array, or None if there was no frame.
+        """
+        rgb = self.convert(frame)
+        if rgb is None:
+            return None
+
+        tmp_path = self.output_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, rgb)
+        os.replace(tmp_path, self.output_path)
+
+        if time.monotonic() - self._last_stats_write >= self.stats_interval:
+            self.write_stats()
+        return rgb
+
+    def stats(self):
+        convert_ms = np.asarray(self._convert_ms) if self._convert_ms else None
+        return {
+            "frames_received": self.frames_received,
+            "frames_converted": self.frames_converted,
+            "frames_skipped": self.frames_received - self.frames_converted,
+            "analysis_fps": self.analysis_fps,
+            "analysis_width": self.analysis_width,
+            "convert_ms_mean": float(convert_ms.mean()) if convert_ms is not None else None,
+            "convert_ms_p95": float(np.percentile(convert_ms, 95)) if convert_ms is not None else None,
+        }
+
+    def write_stats(self):
+        self._last_stats_write = time.monotonic()
+        try:
+            tmp_path = self.stats_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(dict(self.stats(), written_at=time.time()), f)
+            os.replace(tmp_path, self.stats_path)
+        except Exception as e:
+            print(f"⚠️ Failed to write receive stats: {e}")
+
+
+def write_analysis_width(width, path=analysis_width_path):
+    """Ask the server to convert frames at ``width``; None restores its default."""
+    if width is None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"width": int(width)}, f)
+    os.replace(tmp_path, path)
+
+
+def read_receive_stats(path=receive_stats_path):
+    """Latest stats written by the server's FrameReceiver, or None."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+async def webrtc_capture_frame():
+    """Read the latest analysis frame (RGB) published by the server process."""
+    try:
+        # Check if WebRTC is ready by looking for the signal file
+        if not os.path.exists(webrtc_status_path):
+            return {"status": "error", "error": "WebRTC connection not established yet"}
+
+        if os.path.exists(latest_frame_path):
+            # Load in a thread pool to prevent blocking
+            frame = await asyncio.to_thread(np.load, latest_frame_path)
+            if frame is None or frame.size == 0:
+                return {"status": "error", "error": "Failed to read frame from file"}
+            return {"status": "success", "frame": frame}
+        else:
+            return {"status": "error", "error": "No frames available yet"}
+    except Exception as e:
+        return {"status": "error", "error": f"WebRTC error: {str(e)}"}
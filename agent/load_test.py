@@ -0,0 +1,335 @@
+# load_test.py
+"""Synthetic multi-peer load generator for the WebRTC ingest path.
+
+Spins up N local aiortc peers that stream generated (or recorded) video into
+the same SignalingServer / FrameReceiver pipeline server.py uses, with Pusher
+replaced by an in-process stand-in. The peer count ramps up step by step and
+each step reports per-stream received fps, frame age at analysis time, frame
+conversion cost, CPU and memory, giving a capacity curve for the ingest path.
+
+Usage:
+    python load_test.py --ramp 1,2,4,8,16 --step-seconds 20 --analyse
+    python load_test.py --video recordings/session.mkv --ramp 1,4,8
+
+Senders run in the same process, so CPU figures include their encoding cost.
+"""
+import os
+import json
+import time
+import argparse
+import asyncio
+import fractions
+import tempfile
+import numpy as np
+import av
+av.logging.set_level(av.logging.ERROR)
+
+from aiortc import RTCPeerConnection, MediaStreamTrack
+from aiortc.mediastreams import MediaStreamError
+from frame_receiver import FrameReceiver
+from signaling import SignalingServer
+
+# Each frame carries its sequence number as a row of black/white blocks so the
+# receiver can look up when it was sent, whatever the codec does to pts.
+BARCODE_BITS = 24
+BARCODE_BLOCK = 16
+VIDEO_CLOCK_RATE = 90000
+
+
+def stamp_sequence(img, seq):
+    for bit in range(BARCODE_BITS):
+        value = 255 if (seq >> bit) & 1 else 0
+        img[:BARCODE_BLOCK, bit * BARCODE_BLOCK:(bit + 1) * BARCODE_BLOCK] = value
+    return img
+
+
+def read_sequence(rgb, source_width):
+    block = BARCODE_BLOCK * rgb.shape[1] / source_width
+    y0, y1 = int(block / 4), max(int(block * 3 / 4), int(block / 4) + 1)
+    seq = 0
+    for bit in range(BARCODE_BITS):
+        x0 = int(bit * block + block / 4)
+        x1 = max(int(bit * block + block * 3 / 4), x0 + 1)
+        if rgb[y0:y1, x0:x1].mean() > 127:
+            seq |= 1 << bit
+    return seq
+
+
+def load_video_frames(path, width, height, limit=300):
+    """Decode up to ``limit`` frames from a video file as RGB arrays at the stream size."""
+    frames = []
+    with av.open(path) as container:
+        for frame in container.decode(video=0):
+            frames.append(frame.reformat(width=width, height=height, format="rgb24").to_ndarray())
+            if len(frames) >= limit:
+                break
+    if not frames:
+        raise RuntimeError(f"No video frames decoded from {path}")
+    return frames
+
+
+class SyntheticTrack(MediaStreamTrack):
+    """Video track producing paced frames from a generated pattern or recorded frames."""
+
+    kind = "video"
+
+    def __init__(self, width=640, height=480, fps=30, frames=None, seed=0):
+        super().__init__()
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.frames = frames
+        self.sent_at = {}
+        self._seq = -1
+        self._start = None
+        self._phase = seed * 37
+
+        y, x = np.mgrid[0:height, 0:width]
+        self._base = ((x + y) % 256).astype(np.uint8)
+
+    async def recv(self):
+        if self._start is None:
+            self._start = time.monotonic()
+        self._seq += 1
+        wait = self._start + self._seq / self.fps - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        if self.frames:
+            img = self.frames[(self._seq + self._phase) % len(self.frames)].copy()
+        else:
+            shift = (self._seq * 4 + self._phase) % 256
+            channel = self._base + np.uint8(shift)
+            img = np.dstack([channel, np.roll(channel, 64, axis=1), np.roll(channel, 128, axis=0)])
+        stamp_sequence(img, self._seq)
+
+        self.sent_at[self._seq] = time.monotonic()
+        self.sent_at.pop(self._seq - self.fps * 10, None)
+
+        frame = av.VideoFrame.from_ndarray(img, format="rgb24")
+        frame.pts = int(self._seq * VIDEO_CLOCK_RATE / self.fps)
+        frame.time_base = fractions.Fraction(1, VIDEO_CLOCK_RATE)
+        return frame
+
+
+class StreamStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.window_start = time.monotonic()
+        self.received = 0
+        self.analysed = 0
+        self.ages_ms = []
+        self.analysis_ms = []
+        self.analysis_skipped = 0
+        self.convert_ms = []
+
+    def summary(self):
+        elapsed = max(time.monotonic() - self.window_start, 1e-6)
+        return {
+            "fps": self.received / elapsed,
+            "analysed_fps": self.analysed / elapsed,
+            "age_p50_ms": float(np.percentile(self.ages_ms, 50)) if self.ages_ms else None,
+            "age_p95_ms": float(np.percentile(self.ages_ms, 95)) if self.ages_ms else None,
+            "analysis_p50_ms": float(np.percentile(self.analysis_ms, 50)) if self.analysis_ms else None,
+            "analysis_skipped": self.analysis_skipped,
+        }
+
+
+class LoadHarness:
+    """Ingest side of the test: the server's signalling and receive path with local signalling."""
+
+    def __init__(self, args, workdir):
+        self.args = args
+        self.workdir = workdir
+        self.signaling = SignalingServer(self._send_answer, self._on_track)
+        self.answers = {}
+        self.tracks = {}
+        self.stats = {}
+        self.clients = {}
+        self.tasks = []
+        self.video_frames = load_video_frames(args.video, args.width, args.height, limit=args.max_frames) if args.video else None
+        self.process_pose = None
+        self.pose_busy = None
+        if args.analyse:
+            from posture_tools import process_pose, PoseBusy
+            self.process_pose = process_pose
+            self.pose_busy = PoseBusy
+
+    async def _send_answer(self, session_id, description):
+        self.answers[session_id].set_result(description)
+
+    def _on_track(self, session, track):
+        if track.kind == "video":
+            task = asyncio.ensure_future(self._recv_frames(session, track))
+            task.add_done_callback(lambda t, sid=session.session_id: self._report_exit(sid, t))
+            self.tasks.append(task)
+
+    def _report_exit(self, sid, task):
+        # A dead receive loop looks like an fps collapse; make sure the cause is visible
+        if not task.cancelled() and task.exception() is not None:
+            print(f"❌ Receive loop for {sid} failed: {task.exception()!r}")
+
+    async def _recv_frames(self, session, track):
+        sid = session.session_id
+        source = self.tracks[sid]
+        stats = self.stats[sid]
+        receiver = FrameReceiver(
+            analysis_fps=self.args.analysis_fps,
+            output_path=os.path.join(self.workdir, f"{sid}.npy"),
+            stats_path=os.path.join(self.workdir, f"{sid}.json"),
+            # Measure at ANALYSIS_WIDTH rather than whatever a previous agent run left behind
+            width_path=None,
+        )
+        while True:
+            try:
+                frame = await track.recv()
+            except MediaStreamError:
+                break
+            session.mark("first_frame_ms")
+            stats.received += 1
+            if not receiver.submit(frame):
+                continue
+
+            rgb = await asyncio.to_thread(receiver.publish, frame)
+            stats.convert_ms.append(receiver.last_convert_ms)
+            sent_at = source.sent_at.get(read_sequence(rgb, source.width))
+            if sent_at is not None:
+                stats.ages_ms.append((time.monotonic() - sent_at) * 1000)
+            if self.process_pose:
+                started = time.perf_counter()
+                try:
+                    await self.process_pose(rgb)
+                    stats.analysis_ms.append((time.perf_counter() - started) * 1000)
+                except self.pose_busy:
+                    # The agent skips these ticks too; count them rather than stall the stream
+                    stats.analysis_skipped += 1
+            stats.analysed += 1
+
+    async def add_peer(self, index):
+        sid = f"peer-{index}"
+        track = SyntheticTrack(self.args.width, self.args.height, self.args.fps, self.video_frames, seed=index)
+        self.tracks[sid] = track
+        self.stats[sid] = StreamStats()
+        self.answers[sid] = asyncio.get_running_loop().create_future()
+
+        pc = RTCPeerConnection()
+        self.clients[sid] = pc
+        pc.addTrack(track)
+        await pc.setLocalDescription(await pc.createOffer())
+        await self.signaling.handle_offer({"sdp": pc.localDescription.sdp, "type": pc.localDescription.type, "sessionId": sid})
+        await pc.setRemoteDescription(await asyncio.wait_for(self.answers[sid], timeout=30))
+
+    async def remove_peer(self, index):
+        """Hang up one peer and drop the harness's own bookkeeping for it."""
+        sid = f"peer-{index}"
+        pc = self.clients.pop(sid, None)
+        if pc:
+            await pc.close()
+        await self.signaling.close_session(sid)
+        for table in (self.tracks, self.stats, self.answers):
+            table.pop(sid, None)
+        self.tasks = [task for task in self.tasks if not task.done()]
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        for pc in self.clients.values():
+            await pc.close()
+        await self.signaling.close_all()
+
+
+def read_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _fmt(value, spec=".0f"):
+    return "-" if value is None else format(value, spec)
+
+
+async def run(args):
+    ramp = [int(n) for n in args.ramp.split(",")]
+    results = []
+
+    with tempfile.TemporaryDirectory(prefix="load_test_") as workdir:
+        harness = LoadHarness(args, workdir)
+        print(f"{'peers':>5} {'fps/stream':>10} {'min fps':>8} {'age p50':>8} {'age p95':>8} {'conv avg':>8} {'conv p95':>8} {'pose p50':>8} {'skipped':>7} {'cpu %':>6} {'rss MB':>7}")
+        try:
+            for peers in ramp:
+                while len(harness.clients) < peers:
+                    await harness.add_peer(len(harness.clients))
+                await asyncio.sleep(args.warmup)
+
+                for stats in harness.stats.values():
+                    stats.reset()
+                cpu_start, wall_start = time.process_time(), time.monotonic()
+                await asyncio.sleep(args.step_seconds)
+                cpu_pct = (time.process_time() - cpu_start) / (time.monotonic() - wall_start) * 100
+
+                streams = {sid: stats.summary() for sid, stats in harness.stats.items()}
+                ages = [age for stats in harness.stats.values() for age in stats.ages_ms]
+                analysis = [ms for stats in harness.stats.values() for ms in stats.analysis_ms]
+                convert = [ms for stats in harness.stats.values() for ms in stats.convert_ms]
+                skipped = sum(stats.analysis_skipped for stats in harness.stats.values())
+                fps = [s["fps"] for s in streams.values()]
+                step = {
+                    "peers": peers,
+                    "fps_mean": float(np.mean(fps)),
+                    "fps_min": float(np.min(fps)),
+                    "age_p50_ms": float(np.percentile(ages, 50)) if ages else None,
+                    "age_p95_ms": float(np.percentile(ages, 95)) if ages else None,
+                    "analysis_p50_ms": float(np.percentile(analysis, 50)) if analysis else None,
+                    "analysis_skipped": skipped,
+                    "convert_ms_mean": float(np.mean(convert)) if convert else None,
+                    "convert_ms_p95": float(np.percentile(convert, 95)) if convert else None,
+                    "cpu_pct": cpu_pct,
+                    "rss_mb": read_rss_mb(),
+                    "setup": harness.signaling.stats(),
+                    "streams": streams,
+                }
+                results.append(step)
+                print(f"{peers:>5} {step['fps_mean']:>10.1f} {step['fps_min']:>8.1f} {_fmt(step['age_p50_ms']):>8} {_fmt(step['age_p95_ms']):>8} "
+                      f"{_fmt(step['convert_ms_mean'], '.1f'):>8} {_fmt(step['convert_ms_p95'], '.1f'):>8} {_fmt(step['analysis_p50_ms']):>8} {skipped:>7} {cpu_pct:>6.0f} {step['rss_mb']:>7.0f}")
+
+                if step["age_p95_ms"] is not None and step["age_p95_ms"] > args.max_age_ms and not args.full_ramp:
+                    print(f"⚠️ Frame age p95 exceeded {args.max_age_ms:.0f} ms at {peers} peers; stopping ramp.")
+                    break
+        finally:
+            await harness.close()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"📊 Results written to {args.json}")
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Ramp synthetic WebRTC peers against the ingest path.")
+    parser.add_argument("--ramp", default="1,2,4,8", help="comma-separated peer counts to step through")
+    parser.add_argument("--step-seconds", type=float, default=15.0, help="measurement window per step")
+    parser.add_argument("--warmup", type=float, default=3.0, help="settle time after adding peers")
+    parser.add_argument("--fps", type=int, default=30, help="sender frame rate")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--video", help="stream frames from this video file instead of a generated pattern")
+    parser.add_argument("--max-frames", type=int, default=300, help="frames to load from --video; decoded into memory and looped")
+    parser.add_argument("--analyse", action="store_true", help="run MediaPipe Pose on each analysis frame")
+    parser.add_argument("--analysis-fps", type=float, default=2.0)
+    parser.add_argument("--max-age-ms", type=float, default=1000.0, help="frame age p95 at which capacity is considered exceeded")
+    parser.add_argument("--full-ramp", action="store_true", help="keep ramping past the frame age limit")
+    parser.add_argument("--json", help="write per-step results to this file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,293 @@
+# metrics_store.py
+import os
+import json
+import time
+import uuid
+import asyncio
+import threading
+import numpy as np
+
+# Column name -> dtype. Missing values are stored as NaN so a row may fill in
+# only the columns a given check produced (posture and face run independently).
+METRIC_COLUMNS = {
+    "ts": np.float64,
+    "deviation": np.float32,
+    "posture_good": np.float32,
+    "vertical_angle": np.float32,
+    "horizontal_angle": np.float32,
+    "vertical_deviation": np.float32,
+    "horizontal_deviation": np.float32,
+    "looking_down": np.float32,
+    "looking_away": np.float32,
+    "posture_latency_ms": np.float32,
+    "face_latency_ms": np.float32,
+    "escalation_bytes": np.float32,
+    "escalation_encode_ms": np.float32,
+    "escalation_rtt_ms": np.float32,
+    "convert_ms_mean": np.float32,
+    "convert_ms_p95": np.float32,
+}
+
+DEFAULT_METRICS_DIR = "metrics"
+INDEX_FILE = "index.json"
+
+
+class MetricsStore:
+    """Append-only, chunked columnar store for per-tick session metrics.
+
+    Rows are buffered in memory and written as compressed ``.npz`` chunks
+    (one array per column) once ``chunk_rows`` rows or ``flush_interval``
+    seconds have accumulated. An ``index.json`` manifest records each chunk's
+    time range so range queries only open the chunks they need.
+
+    ``append`` only buffers; callers on an event loop should ``await
+    flush_async()`` when it reports a flush is due, so chunk compression and
+    disk writes run in a worker thread.
+    """
+
+    def __init__(self, root=DEFAULT_METRICS_DIR, session_id=None, chunk_rows=1024, flush_interval=30.0, columns=None):
+        self.columns = dict(columns or METRIC_COLUMNS)
+        if "ts" not in self.columns:
+            raise ValueError("Metrics schema must include a 'ts' column")
+        self.session_id = session_id or time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:6]
+        self.path = os.path.join(root, self.session_id)
+        self.chunk_rows = chunk_rows
+        self.flush_interval = flush_interval
+        os.makedirs(self.path, exist_ok=True)
+
+        self._index = self._load_index()
+        self._buffer = {name: [] for name in self.columns}
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+        # Rows taken from the buffer but not yet on disk; still visible to queries
+        self._pending = []
+        self._write_lock = threading.Lock()
+        self._swap_lock = threading.Lock()
+
+    def _index_path(self):
+        return os.path.join(self.path, INDEX_FILE)
+
+    def _load_index(self):
+        if os.path.exists(self._index_path()):
+            try:
+                with open(self._index_path()) as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"Error loading metrics index: {e}")
+        return []
+
+    def append(self, ts=None, **values):
+        """Buffer one row. Unknown columns are ignored, missing ones become NaN.
+
+        Returns True once ``chunk_rows`` rows or ``flush_interval`` seconds have
+        accumulated and the caller should flush.
+        """
+        self._buffer["ts"].append(time.time() if ts is None else ts)
+        for name in self.columns:
+            if name == "ts":
+                continue
+            value = values.get(name)
+            self._buffer[name].append(np.nan if value is None else float(value))
+        self._buffered += 1
+
+        return self._buffered >= self.chunk_rows or time.monotonic() - self._last_flush >= self.flush_interval
+
+    def _take_buffer(self):
+        self._last_flush = time.monotonic()
+        if not self._buffered:
+            return
+        arrays = {name: np.asarray(values, dtype=self.columns[name]) for name, values in self._buffer.items()}
+        with self._swap_lock:
+            self._pending = self._pending + [arrays]
+        self._buffer = {name: [] for name in self.columns}
+        self._buffered = 0
+
+    def _write_pending(self):
+        """Write pending rows as new chunks and update the manifest. Failed chunks stay pending."""
+        with self._write_lock:
+            while self._pending:
+                arrays = self._pending[0]
+                chunk_name = f"chunk_{len(self._index):06d}.npz"
+                try:
+                    np.savez_compressed(os.path.join(self.path, chunk_name), **arrays)
+                    index = self._index + [{
+                        "file": chunk_name,
+                        "t_min": float(arrays["ts"].min()),
+                        "t_max": float(arrays["ts"].max()),
+                        "rows": int(len(arrays["ts"])),
+                    }]
+                    tmp_path = self._index_path() + ".tmp"
+                    with open(tmp_path, "w") as f:
+                        json.dump(index, f)
+                    os.replace(tmp_path, self._index_path())
+                except Exception as e:
+                    print(f"Error writing metrics chunk: {e}")
+                    return False
+                # Swap both together so a concurrent query sees the rows exactly once
+                with self._swap_lock:
+                    self._index, self._pending = index, self._pending[1:]
+            return True
+
+    def flush(self):
+        """Write buffered rows to disk on the calling thread."""
+        self._take_buffer()
+        return self._write_pending()
+
+    async def flush_async(self):
+        """``flush`` with the disk write in a worker thread, keeping it off the event loop."""
+        self._take_buffer()
+        if not self._pending:
+            return True
+        return await asyncio.to_thread(self._write_pending)
+
+    def close(self):
+        self.flush()
+
+    def query(self, start=None, end=None, columns=None):
+        """Return ``{column: ndarray}`` for rows with ``start <= ts <= end``, sorted by ts.
+
+        Includes rows that are still buffered. Columns absent from older chunks
+        are filled with NaN.
+        """
+        wanted = list(columns or self.columns)
+        if "ts" not in wanted:
+            wanted.insert(0, "ts")
+        lo = -np.inf if start is None else start
+        hi = np.inf if end is None else end
+
+        with self._swap_lock:
+            index, pending = self._index, self._pending
+        parts = {name: [] for name in wanted}
+        for entry in index:
+            if entry["t_max"] < lo or entry["t_min"] > hi:
+                continue
+            with np.load(os.path.join(self.path, entry["file"])) as chunk:
+                self._collect(parts, {name: chunk[name] for name in chunk.files}, entry["rows"], lo, hi)
+
+        for arrays in pending:
+            self._collect(parts, arrays, len(arrays["ts"]), lo, hi)
+        if self._buffered:
+            buffered = {name: np.asarray(values, dtype=self.columns[name]) for name, values in self._buffer.items()}
+            self._collect(parts, buffered, self._buffered, lo, hi)
+
+        result = {}
+        for name in wanted:
+            dtype = self.columns.get(name, np.float32)
+            result[name] = np.concatenate(parts[name]) if parts[name] else np.empty(0, dtype=dtype)
+        order = np.argsort(result["ts"], kind="stable")
+        return {name: values[order] for name, values in result.items()}
+
+    def _collect(self, parts, arrays, rows, lo, hi):
+        mask = (arrays["ts"] >= lo) & (arrays["ts"] <= hi)
+        if not mask.any():
+            return
+        for name in parts:
+            if name in arrays:
+                parts[name].append(arrays[name][mask])
+            else:
+                parts[name].append(np.full(rows, np.nan, dtype=self.columns.get(name, np.float32))[mask])
+
+    def downsample(self, bucket_seconds, start=None, end=None, columns=None):
+        """Average each column over fixed time buckets, ignoring NaNs.
+
+        Returns ``{"ts": bucket_starts, column: means, ..., "samples": counts}``.
+        Buckets with no rows are omitted.
+        """
+        data = self.query(start, end, columns)
+        ts = data.pop("ts")
+        if not len(ts):
+            return {"ts": np.empty(0), "samples": np.empty(0, dtype=np.int64), **{name: np.empty(0) for name in data}}
+
+        bucket_ids = np.floor(ts / bucket_seconds).astype(np.int64)
+        unique_ids, inverse, counts = np.unique(bucket_ids, return_inverse=True, return_counts=True)
+
+        result = {"ts": unique_ids * float(bucket_seconds), "samples": counts}
+        for name, values in data.items():
+            values = values.astype(np.float64)
+            valid = ~np.isnan(values)
+            sums = np.bincount(inverse, weights=np.where(valid, values, 0.0), minlength=len(unique_ids))
+            valid_counts = np.bincount(inverse, weights=valid, minlength=len(unique_ids))
+            with np.errstate(invalid="ignore", divide="ignore"):
+                result[name] = np.where(valid_counts > 0, sums / valid_counts, np.nan)
+        return result
+
+    def per_minute(self, start=None, end=None, columns=None):
+        """Per-minute averages, the rollup used by dashboards and session reports."""
+        return self.downsample(60, start, end, columns)
+
+    def time_in_state(self, column, value=1.0, start=None, end=None, max_gap=5.0):
+        """Seconds spent with ``column == value``.
+
+        Each sample holds until the next sample of the same column, capped at
+        ``max_gap`` seconds so pauses in monitoring are not counted.
+        """
+        data = self.query(start, end, [column])
+        ts, values = data["ts"], data[column]
+        valid = ~np.isnan(values)
+        ts, values = ts[valid], values[valid]
+        if len(ts) < 2:
+            return 0.0
+        durations = np.minimum(np.diff(ts), max_gap)
+        return float(durations[values[:-1] == value].sum())
+
+    def time_in_bad_posture(self, start=None, end=None, max_gap=5.0):
+        return self.time_in_state("posture_good", 0.0, start, end, max_gap)
+
+    def summary(self, start=None, end=None):
+        """Session-level rollup of the stored metrics."""
+        data = self.query(start, end, ["deviation", "posture_good", "looking_down", "posture_latency_ms", "face_latency_ms", "escalation_bytes", "escalation_rtt_ms", "convert_ms_mean"])
+        ts = data["ts"]
+
+        def _nanmean(values):
+            values = values[~np.isnan(values)]
+            return float(values.mean()) if len(values) else None
+
+        def _nanpercentile(values, q):
+            values = values[~np.isnan(values)]
+            return float(np.percentile(values, q)) if len(values) else None
+
+        return {
+            "samples": int(len(ts)),
+            "duration_s": float(ts[-1] - ts[0]) if len(ts) > 1 else 0.0,
+            "mean_deviation": _nanmean(data["deviation"]),
+            "time_in_bad_posture_s": self.time_in_bad_posture(start, end),
+            "time_looking_down_s": self.time_in_state("looking_down", 1.0, start, end),
+            "posture_latency_p99_ms": _nanpercentile(data["posture_latency_ms"], 99),
+            "face_latency_p99_ms": _nanpercentile(data["face_latency_ms"], 99),
+            "escalations": int((~np.isnan(data["escalation_bytes"])).sum()),
+            "escalation_mean_bytes": _nanmean(data["escalation_bytes"]),
+            "escalation_rtt_p99_ms": _nanpercentile(data["escalation_rtt_ms"], 99),
+            "convert_ms_mean": _nanmean(data["convert_ms_mean"]),
+        }
+
+
+def open_session(session_id, root=DEFAULT_METRICS_DIR):
+    """Open an existing session for querying (appending is also allowed)."""
+    path = os.path.join(root, session_id)
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f"No metrics session at {path}")
+    return MetricsStore(root=root, session_id=session_id)
+
+
+def list_sessions(root=DEFAULT_METRICS_DIR):
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root) if os.path.exists(os.path.join(root, name, INDEX_FILE)))
+
+
+if __name__ == "__main__":
+    import sys
+
+    sessions = list_sessions()
+    if not sessions:
+        print("No metrics sessions found.")
+        sys.exit(1)
+
+    store = open_session(sys.argv[1] if len(sys.argv) > 1 else sessions[-1])
+    print(f"📊 Session {store.session_id}")
+    for key, value in store.summary().items():
+        print(f"   - {key}: {value}")
+
+    minutes = store.per_minute(columns=["deviation", "posture_good"])
+    for start, deviation, good in zip(minutes["ts"], minutes["deviation"], minutes["posture_good"]):
+        print(f"   {time.strftime('%H:%M', time.localtime(start))}  deviation={deviation:.3f}  good={good:.0%}")
@@ -0,0 +1,136 @@
+# pose_tuner.py
+import os
+import time
+from collections import deque
+import numpy as np
+import cv2
+import mediapipe as mp
+
+mp_pose = mp.solutions.pose
+
+POSE_LATENCY_BUDGET_MS = float(os.getenv("POSE_LATENCY_BUDGET_MS", "80"))
+# Candidate settings, listed from least to most accurate within each dimension
+POSE_COMPLEXITIES = (0, 1, 2)
+POSE_INPUT_WIDTHS = (320, 480, 640)
+
+
+def resize_to_width(frame, width):
+    if not width or frame.shape[1] <= width:
+        return frame
+    height = int(round(frame.shape[0] * width / frame.shape[1]))
+    return cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+
+class PoseTuner:
+    """Picks the most accurate MediaPipe Pose setting that fits a per-frame latency budget.
+
+    A tier is ``(model_complexity, input_width)``; complexity outranks input
+    width for accuracy. ``benchmark_and_choose`` measures the candidate tiers
+    on a real frame. The first run picks the complexity; later runs keep it,
+    because calibration baselines come from that model, and only change the
+    input width. ``observe`` tracks live inference latency so the choice can
+    be re-evaluated when sustained load pushes the p90 over budget, or when
+    the benchmark, scaled to the current load, says the next tier would fit.
+    Retunes that keep the same tier double the cooldown, up to
+    ``max_cooldown``.
+    """
+
+    def __init__(self, budget_ms=POSE_LATENCY_BUDGET_MS, complexities=POSE_COMPLEXITIES, widths=POSE_INPUT_WIDTHS,
+                 runs=5, warmup=2, window=40, cooldown=300.0, max_cooldown=3600.0):
+        self.budget_ms = budget_ms
+        self.tiers = sorted((c, w) for c in complexities for w in widths)
+        self.runs = runs
+        self.warmup = warmup
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+
+        self.current = None
+        self.results = {}
+        self.tuning = False
+        self.retune_reason = None
+        self._latencies = deque(maxlen=window)
+        self._last_tuned = None
+        self._cooldown = cooldown
+
+    def observe(self, latency_ms):
+        self._latencies.append(latency_ms)
+
+    def candidates(self):
+        """Tiers a benchmark may pick from: all of them at first, then only the current complexity."""
+        if self.current is None:
+            return self.tiers
+        return [tier for tier in self.tiers if tier[0] == self.current[0]]
+
+    def needs_retune(self):
+        """True once sustained latency says the current tier no longer fits (or underuses) the budget."""
+        if self.tuning or self.current is None or len(self._latencies) < self._latencies.maxlen:
+            return False
+        if self._last_tuned is not None and time.monotonic() - self._last_tuned < self._cooldown:
+            return False
+
+        p90 = float(np.percentile(self._latencies, 90))
+        if p90 > self.budget_ms:
+            self.retune_reason = f"p90 {p90:.0f} ms over {self.budget_ms:.0f} ms budget"
+            return True
+
+        # Scale the next tier's benchmark by how loaded the host is now compared with then
+        candidates = self.candidates()
+        position = candidates.index(self.current) if self.current in candidates else len(candidates) - 1
+        if position + 1 >= len(candidates) or not self.results.get(self.current):
+            return False
+        following = candidates[position + 1]
+        if following not in self.results:
+            return False
+        predicted = self.results[following] * p90 / self.results[self.current]
+        if predicted <= self.budget_ms:
+            self.retune_reason = f"p90 {p90:.0f} ms leaves room for {following[0]}@{following[1]} (~{predicted:.0f} ms)"
+            return True
+        return False
+
+    def benchmark(self, frame, tiers=None):
+        """Median inference latency in ms for each tier (default: all) that runs on this host."""
+        tiers = self.tiers if tiers is None else tiers
+        results = {}
+        for complexity in sorted({c for c, _ in tiers}):
+            try:
+                model = mp_pose.Pose(model_complexity=complexity, min_detection_confidence=0.5, min_tracking_confidence=0.5)
+            except Exception as e:
+                print(f"⚠️ Pose model complexity {complexity} unavailable: {e}")
+                continue
+            try:
+                for tier in tiers:
+                    if tier[0] != complexity:
+                        continue
+                    image = resize_to_width(frame, tier[1])
+                    timings = []
+                    for i in range(self.warmup + self.runs):
+                        started = time.perf_counter()
+                        model.process(image)
+                        if i >= self.warmup:
+                            timings.append((time.perf_counter() - started) * 1000)
+                    results[tier] = float(np.median(timings))
+            finally:
+                model.close()
+        return results
+
+    def choose(self, results):
+        """Most accurate tier within budget, else the fastest one measured."""
+        fitting = [tier for tier in self.tiers if tier in results and results[tier] <= self.budget_ms]
+        if fitting:
+            return fitting[-1]
+        return min(results, key=results.get) if results else None
+
+    def benchmark_and_choose(self, frame):
+        self.tuning = True
+        try:
+            previous = self.current
+            self.results = self.benchmark(frame, self.candidates())
+            tier = self.choose(self.results)
+            if tier is not None:
+                self.current = tier
+            self._cooldown = min(self._cooldown * 2, self.max_cooldown) if tier == previous else self.cooldown
+            return tier
+        finally:
+            self._latencies.clear()
+            self._last_tuned = time.monotonic()
+            self.tuning = False
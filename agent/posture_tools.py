@@ -6,12 +6,132 @@ import mediapipe as mp
 import os
 import math
 import time
-from server import webrtc_capture_frame
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from frame_receiver import webrtc_capture_frame, write_analysis_width
+from pose_tuner import PoseTuner, resize_to_width
 
 mp_pose = mp.solutions.pose
 pose = mp_pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5)
+pose_input_width = None
+pose_tuner = PoseTuner()
 calibrated_features = None
 calibrated_face_angle = None
+_pose_lock = threading.Lock()
+_retune_task = None
+# Inference gets its own thread so a slow model can't starve the default executor.
+# One call running plus one waiting lets posture and attention ticks that land
+# together both run; anything beyond that is a backlog from overrun ticks.
+POSE_MAX_INFLIGHT = 2
+_pose_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pose")
+_pose_inflight = set()
+
+class PoseBusy(RuntimeError):
+    """Raised when earlier pose inferences are still running and this one should be skipped."""
+
+def configure_pose(model_complexity, input_width=None):
+    """Swap in a Pose model of the given complexity, fed frames no wider than input_width."""
+    global pose, pose_input_width
+    new_pose = mp_pose.Pose(model_complexity=model_complexity, min_detection_confidence=0.5, min_tracking_confidence=0.5)
+    with _pose_lock:
+        old_pose, pose = pose, new_pose
+        pose_input_width = input_width
+    old_pose.close()
+
+def _process_pose_sync(frame):
+    with _pose_lock:
+        # The server normally converts at pose_input_width already; this only catches
+        # frames published before it picked up a new width. Landmarks are normalised,
+        # so downscaling doesn't change their meaning
+        frame = resize_to_width(frame, pose_input_width)
+        started = time.perf_counter()
+        result = pose.process(frame)
+        pose_tuner.observe((time.perf_counter() - started) * 1000)
+        return result
+
+async def process_pose(frame):
+    """Run MediaPipe Pose on the pose thread so inference never blocks the event loop.
+
+    A cancelled caller doesn't stop an inference that has started, so when
+    POSE_MAX_INFLIGHT calls are still pending this raises PoseBusy instead of
+    queueing behind them.
+    """
+    global _retune_task
+    _pose_inflight.difference_update([f for f in _pose_inflight if f.done()])
+    if len(_pose_inflight) >= POSE_MAX_INFLIGHT:
+        raise PoseBusy("Pose inference from an earlier tick is still running")
+    future = _pose_executor.submit(_process_pose_sync, frame)
+    _pose_inflight.add(future)
+    result = await asyncio.wrap_future(future)
+    if pose_tuner.needs_retune() and (_retune_task is None or _retune_task.done()):
+        print(f"🧠 Re-evaluating pose model: {pose_tuner.retune_reason}")
+        _retune_task = asyncio.create_task(_tune_pose(frame))
+        _retune_task.add_done_callback(_report_retune)
+    return result
+
+def _report_retune(task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"⚠️ Pose model re-evaluation failed: {str(task.exception())}")
+
+async def _full_width_frame(frame, timeout=3.0):
+    """A frame wide enough to benchmark every candidate width.
+
+    Frames arrive at the width currently in use, so ask the server for its
+    default width again and wait briefly for one to be published.
+    """
+    widest = max(width for _, width in pose_tuner.candidates())
+    if frame.shape[1] >= widest:
+        return frame
+    await asyncio.to_thread(write_analysis_width, None)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.25)
+        capture_result = await webrtc_capture_frame()
+        if capture_result["status"] == "success" and capture_result["frame"].shape[1] > frame.shape[1]:
+            return capture_result["frame"]
+    return frame
+
+async def _tune_pose(frame):
+    loop = asyncio.get_running_loop()
+    previous = pose_tuner.current
+    try:
+        frame = await _full_width_frame(frame)
+        # Benchmark on the pose thread: live inference waits (and ticks skip) rather
+        # than competing for the CPU and inflating the measurements
+        tier = await loop.run_in_executor(_pose_executor, pose_tuner.benchmark_and_choose, frame)
+        if tier is not None and tier != previous:
+            await loop.run_in_executor(_pose_executor, configure_pose, *tier)
+    finally:
+        # Have the server convert straight to the width in use
+        if pose_tuner.current is not None:
+            await asyncio.to_thread(write_analysis_width, pose_tuner.current[1])
+    if tier is None:
+        return None
+    complexity, width = tier
+    print(f"🧠 Pose model: complexity {complexity} at {width}px ({pose_tuner.results[tier]:.0f} ms, budget {pose_tuner.budget_ms:.0f} ms)")
+    return tier
+
+async def tune_pose_model_tool():
+    """Tool for benchmarking pose model settings on this machine and picking the best that fits the latency budget."""
+    capture_result = await webrtc_capture_frame()
+    if capture_result["status"] != "success":
+        return {"status": "error", "error": capture_result.get('error', 'Camera access failed')}
+    
+    try:
+        tier = await _tune_pose(capture_result["frame"])
+    except Exception as e:
+        return {"status": "error", "error": f"Pose benchmark failed: {str(e)}"}
+    if tier is None:
+        return {"status": "error", "error": "No pose model setting could be benchmarked"}
+    
+    return {
+        "status": "success",
+        "model_complexity": tier[0],
+        "input_width": tier[1],
+        "latency_ms": pose_tuner.results[tier],
+        "budget_ms": pose_tuner.budget_ms,
+        "benchmark": {f"{c}@{w}": ms for (c, w), ms in pose_tuner.results.items()}
+    }
 
 async def capture_pose_features():
     """Capture a frame from the camera and extract pose features."""
@@ -20,8 +140,7 @@ async def capture_pose_features():
         
     frame = capture_result["frame"]
         
-    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    result = pose.process(frame_rgb)
+    result = await process_pose(frame)
     
     if not result.pose_landmarks:
         raise RuntimeError("No pose landmarks detected. Make sure your face and upper body are visible.")
@@ -106,6 +225,8 @@ async def posture_check_tool():
         
         try:
             current_features = await capture_pose_features()
+        except PoseBusy as e:
+            return {"status": "skipped", "error": str(e)}
         except Exception as e:
             return {"status": "error", "error": f"Posture capture failed: {str(e)}"}
         
@@ -204,8 +325,7 @@ async def calibrate_face_angle_tool():
         frame = capture_result["frame"]
         
         try:
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            result = pose.process(frame_rgb)
+            result = await process_pose(frame)
             
             if not result.pose_landmarks:
                 print("⚠️ No face landmarks detected in this frame. Retrying...")
@@ -260,8 +380,10 @@ async def check_face_angle_tool():
         
         frame = capture_result["frame"]
         
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        result = pose.process(frame_rgb)
+        try:
+            result = await process_pose(frame)
+        except PoseBusy as e:
+            return {"status": "skipped", "error": str(e)}
         
         if not result.pose_landmarks:
             return {"status": "error", "error": "No face landmarks detected."}
@@ -302,7 +424,9 @@ async def check_face_angle_tool():
             "calibrated_angles": {
                 "vertical": float(calibrated_face_angle["vertical_angle"]),
                 "horizontal": float(calibrated_face_angle["horizontal_angle"])
-            }
+            },
+            "frame": frame,
+            "landmarks": landmarks
         }
         
     except Exception as e:
@@ -369,8 +493,7 @@ async def calibrate_posture_tool():
         frame = capture_result["frame"]
         
         try:
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            result = pose.process(frame_rgb)
+            result = await process_pose(frame)
             
             if not result.pose_landmarks:
                 print("⚠️ No pose landmarks detected in this frame. Retrying...")
@@ -0,0 +1,187 @@
+# sampling_governor.py
+import os
+import json
+import math
+import time
+from frame_receiver import FRAMES_DIR
+
+# Runtime control arrives on the Pusher 'control' channel in the server process
+# and reaches the agent subprocess through this file. The agent reports the
+# resulting state on stdout, which the server forwards.
+sampling_control_path = os.path.join(FRAMES_DIR, "sampling_control.json")
+
+SAMPLING_MIN_INTERVAL = float(os.getenv("SAMPLING_MIN_INTERVAL", "0.5"))
+SAMPLING_MAX_INTERVAL = float(os.getenv("SAMPLING_MAX_INTERVAL", "5.0"))
+SAMPLING_CPU_BUDGET = float(os.getenv("SAMPLING_CPU_BUDGET", "0.5"))
+# Shortest interval a control message may ask for; below this pose runs almost back to back
+SAMPLING_INTERVAL_FLOOR = 0.25
+
+
+class SamplingGovernor:
+    """Chooses the analysis interval from posture stability and a CPU budget.
+
+    Any motion or near-threshold reading snaps the interval back to
+    ``min_interval``. Once readings have been stable for ``stable_after``
+    seconds the interval backs off towards ``max_interval``. The interval
+    never drops below what keeps the measured analysis cost within
+    ``cpu_budget`` (fraction of one core), in either adaptive or fixed mode.
+    """
+
+    def __init__(self, min_interval=SAMPLING_MIN_INTERVAL, max_interval=SAMPLING_MAX_INTERVAL, cpu_budget=SAMPLING_CPU_BUDGET,
+                 stable_after=20.0, backoff=1.25, near_threshold=0.75, deviation_motion=0.03, angle_motion=4.0,
+                 control_path=sampling_control_path):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.cpu_budget = cpu_budget
+        self.stable_after = stable_after
+        self.backoff = backoff
+        self.near_threshold = near_threshold
+        self.deviation_motion = deviation_motion
+        self.angle_motion = angle_motion
+
+        self.mode = "adaptive"
+        self.fixed_interval = None
+        self.interval = min_interval
+        self.reason = "startup"
+
+        self._last_active = time.monotonic()
+        self._active_reason = "startup"
+        self._last_deviation = None
+        self._last_angles = None
+        self._cost_ms = {}
+        # A control file left over from an earlier session is not re-applied
+        self.control_path = control_path
+        self._control_mtime = self._mtime()
+
+    def observe_posture(self, deviation, threshold):
+        if deviation >= threshold * self.near_threshold:
+            self._mark_active("near threshold")
+        elif self._last_deviation is not None and abs(deviation - self._last_deviation) > self.deviation_motion:
+            self._mark_active("motion")
+        self._last_deviation = deviation
+
+    def observe_face(self, vertical_angle, horizontal_angle, looking_down=False):
+        if looking_down:
+            self._mark_active("looking down")
+        elif self._last_angles is not None:
+            moved = max(abs(vertical_angle - self._last_angles[0]), abs(horizontal_angle - self._last_angles[1]))
+            if moved > self.angle_motion:
+                self._mark_active("motion")
+        self._last_angles = (vertical_angle, horizontal_angle)
+
+    def observe_cost(self, stage, latency_ms):
+        previous = self._cost_ms.get(stage)
+        self._cost_ms[stage] = latency_ms if previous is None else previous * 0.8 + latency_ms * 0.2
+
+    def _mark_active(self, reason):
+        self._last_active = time.monotonic()
+        self._active_reason = reason
+        if self.mode == "adaptive" and self.interval > self.min_interval:
+            # Ramp up immediately rather than waiting for the next update
+            self.interval = max(self.min_interval, self.budget_floor())
+            self.reason = reason
+
+    def budget_floor(self):
+        """Shortest interval whose analysis cost fits in the CPU budget."""
+        if self.cpu_budget <= 0:
+            return self.min_interval
+        return sum(self._cost_ms.values()) / 1000 / self.cpu_budget
+
+    def update(self):
+        """Recompute the interval. Returns True if it changed noticeably."""
+        if self.mode == "fixed" and self.fixed_interval:
+            target, reason = self.fixed_interval, "fixed"
+        elif time.monotonic() - self._last_active < self.stable_after:
+            target, reason = self.min_interval, self._active_reason
+        else:
+            target, reason = min(self.max_interval, self.interval * self.backoff), "stable"
+
+        floor = self.budget_floor()
+        if target < floor:
+            target, reason = floor, "cpu budget"
+
+        changed = abs(target - self.interval) >= 0.05 * self.interval
+        self.interval = target
+        self.reason = reason
+        return changed
+
+    def apply_control(self, control):
+        """Apply a control message: mode, interval, cpuBudget, minInterval, maxInterval.
+
+        The whole message is validated first; an invalid one raises ValueError
+        and leaves the current settings untouched. A cpuBudget of 0 disables
+        the budget.
+        """
+        mode = control.get("mode", self.mode)
+        if mode not in ("adaptive", "fixed"):
+            raise ValueError(f"unknown mode {mode!r}")
+        fixed_interval = _control_number(control, "interval", self.fixed_interval, SAMPLING_INTERVAL_FLOOR)
+        if control.get("interval") is not None and "mode" not in control:
+            mode = "fixed"
+        cpu_budget = _control_number(control, "cpuBudget", self.cpu_budget, 0.0)
+        if cpu_budget > (os.cpu_count() or 1):
+            raise ValueError(f"cpuBudget {cpu_budget} exceeds the {os.cpu_count()} available cores")
+        min_interval = _control_number(control, "minInterval", self.min_interval, SAMPLING_INTERVAL_FLOOR)
+        max_interval = _control_number(control, "maxInterval", self.max_interval, SAMPLING_INTERVAL_FLOOR)
+        if min_interval > max_interval:
+            raise ValueError(f"minInterval {min_interval} is above maxInterval {max_interval}")
+
+        self.mode = mode
+        self.fixed_interval = fixed_interval
+        self.cpu_budget = cpu_budget
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+
+    def _mtime(self):
+        try:
+            return os.path.getmtime(self.control_path)
+        except OSError:
+            return None
+
+    def poll_control(self):
+        """Apply the control file if it changed since the last poll."""
+        mtime = self._mtime()
+        if mtime is None or mtime == self._control_mtime:
+            return False
+        self._control_mtime = mtime
+        try:
+            with open(self.control_path) as f:
+                self.apply_control(json.load(f))
+        except Exception as e:
+            print(f"⚠️ Ignoring sampling control: {e}")
+            return False
+        return True
+
+    def state(self):
+        return {
+            "mode": self.mode,
+            "interval": self.interval,
+            "reason": self.reason,
+            "cpuBudget": self.cpu_budget,
+            "minInterval": self.min_interval,
+            "maxInterval": self.max_interval,
+            "costMs": sum(self._cost_ms.values()),
+        }
+
+
+def _control_number(control, key, default, lower):
+    if control.get(key) is None:
+        return default
+    try:
+        value = float(control[key])
+    except (TypeError, ValueError):
+        raise ValueError(f"{key} must be a number, got {control[key]!r}")
+    if not math.isfinite(value) or value < lower:
+        raise ValueError(f"{key} must be a number of at least {lower}, got {control[key]!r}")
+    return value
+
+
+def _write_json(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def write_sampling_control(control, path=sampling_control_path):
+    _write_json(path, control)
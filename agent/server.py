@@ -6,14 +6,17 @@ import time
 import logging
 import asyncio
 import json
-import cv2
 import av
 av.logging.set_level(av.logging.ERROR)
 
 import pusher
 import pusherclient
 from dotenv import load_dotenv
-from aiortc import RTCPeerConnection, RTCSessionDescription, RTCIceCandidate
+from aiortc.mediastreams import MediaStreamError
+from frame_receiver import FrameReceiver, FRAMES_DIR, webrtc_status_path, write_analysis_width
+from signaling import SignalingServer
+from sampling_governor import write_sampling_control
+from session_recorder import SessionRecorder, RECORD_SESSIONS
 
 load_dotenv()
 
@@ -38,89 +41,97 @@ ws_pusher.connection.bind('pusher:error', lambda data: print(f"❌ Pusher error:
 loop = asyncio.new_event_loop()
 threading.Thread(target=loop.run_forever, daemon=True).start()
 
-frame_queue = asyncio.Queue()
-tcs = set()
-
 webrtc_ready = threading.Event()
 
-os.makedirs("frames", exist_ok=True)
-latest_frame_path = os.path.join("frames", "latest_frame.jpg")
-webrtc_status_path = os.path.join("frames", "webrtc_ready")
-
-async def handle_offer(data):
-    offer = json.loads(data)
-    pc = RTCPeerConnection()
-    tcs.add(pc)
-
-    @pc.on("track")
-    def on_track(track):
-        if track.kind == "video":
-            async def recv_frames():
-                webrtc_ready.set()
-                with open(webrtc_status_path, "w") as f:
-                    f.write("ready")
-                    
+os.makedirs(FRAMES_DIR, exist_ok=True)
+
+# Recorders for sessions currently streaming, so agent events land in their sidecars
+active_recorders = set()
+
+def emit_log(event, line):
+    http_pusher.trigger('logs', event, {'message': line})
+    for recorder in list(active_recorders):
+        recorder.log_event(event, line)
+
+def on_track(session, track):
+    if track.kind == "video":
+        receiver = FrameReceiver()
+        recorder = SessionRecorder(session.session_id) if RECORD_SESSIONS else None
+        if recorder:
+            active_recorders.add(recorder)
+            print(f"⏺️ Recording {session.session_id} to {recorder.video_path}")
+
+        async def recv_frames():
+            webrtc_ready.set()
+            with open(webrtc_status_path, "w") as f:
+                f.write("ready")
+                
+            try:
                 while True:
-                    frame = await track.recv()
-                    img = frame.to_ndarray(format="bgr24")
-                    
-                    cv2.imwrite(latest_frame_path, img)
-                    
-                    await frame_queue.put(img)
-            asyncio.run_coroutine_threadsafe(recv_frames(), loop)
-
-    desc = RTCSessionDescription(offer['sdp'], offer['type'])
-    await pc.setRemoteDescription(desc)
-    answer = await pc.createAnswer()
-    await pc.setLocalDescription(answer)
-
-    http_pusher.trigger('webrtc-signaling', 'answer', {
-        'sdp': pc.localDescription.sdp,
-        'type': pc.localDescription.type
+                    try:
+                        frame = await track.recv()
+                    except MediaStreamError:
+                        print(f"🔹 Video track for {session.session_id} ended.")
+                        break
+                    if session.mark("first_frame_ms"):
+                        print(f"📶 Peer {session.session_id}: first frame {session.timings['first_frame_ms']:.0f} ms after offer")
+                    if recorder:
+                        recorder.submit(frame)
+                    # Only frames due for analysis are converted, off the event loop
+                    if receiver.submit(frame):
+                        await asyncio.to_thread(receiver.publish, frame)
+            finally:
+                if recorder:
+                    active_recorders.discard(recorder)
+                    await asyncio.to_thread(recorder.close)
+        asyncio.run_coroutine_threadsafe(recv_frames(), loop)
+
+async def send_answer(session_id, description):
+    # The Pusher HTTP client blocks; don't hold up other peers' setup
+    await asyncio.to_thread(http_pusher.trigger, 'webrtc-signaling', 'answer', {
+        'sdp': description.sdp,
+        'type': description.type,
+        'sessionId': session_id
     })
 
-async def handle_candidate(data):
-    cand = json.loads(data)
-    ice = RTCIceCandidate(
-        sdpMid=cand.get('sdpMid'),
-        sdpMLineIndex=cand.get('sdpMLineIndex'),
-        candidate=cand.get('candidate')
-    )
-    for pc in tcs:
-        await pc.addIceCandidate(ice)
+signaling = SignalingServer(send_answer, on_track)
+
+def emit_sampling(line):
+    """Publish the sampling state the agent reported after applying a change."""
+    try:
+        state = json.loads(line.split(" ", 2)[2])
+    except (IndexError, ValueError):
+        print(f"⚠️ Invalid sampling state: {line}")
+        return
+    http_pusher.trigger('logs', 'sampling', state)
+    for recorder in list(active_recorders):
+        recorder.log_event('sampling', state)
+
+def on_sampling_control(data):
+    """Forward a sampling control message to the agent, which replies with its new state.
+
+    An empty message is still forwarded so the agent reports its current rate.
+    """
+    try:
+        control = json.loads(data) if data else {}
+    except ValueError:
+        print(f"⚠️ Invalid sampling control: {data}")
+        return
+    write_sampling_control(control)
 
 def on_connect(data):
     ctrl = ws_pusher.subscribe('control')
     ctrl.bind('start', lambda d: start_agent())
+    ctrl.bind('sampling', on_sampling_control)
     sig = ws_pusher.subscribe('webrtc-signaling')
-    sig.bind('offer', lambda d: asyncio.run_coroutine_threadsafe(handle_offer(d), loop))
-    sig.bind('candidate', lambda d: asyncio.run_coroutine_threadsafe(handle_candidate(d), loop))
+    sig.bind('offer', lambda d: asyncio.run_coroutine_threadsafe(signaling.handle_offer(d), loop))
+    sig.bind('candidate', lambda d: asyncio.run_coroutine_threadsafe(signaling.handle_candidate(d), loop))
     print("🔗 Subscribed to 'control' & 'webrtc-signaling'")
 
 ws_pusher.connection.bind('pusher:connection_established', on_connect)
 ws_pusher.connect()
 print("🚀 Pusher client initialized, awaiting control & signaling...")
 
-frames_received = False
-
-async def webrtc_capture_frame():
-    try:
-        # Check if WebRTC is ready by looking for the signal file
-        if not os.path.exists(webrtc_status_path):
-            return {"status": "error", "error": "WebRTC connection not established yet"}
-            
-        # Try to get frame from the image file
-        if os.path.exists(latest_frame_path):
-            # Run CV2 image reading in a thread pool to prevent blocking
-            frame = await asyncio.to_thread(cv2.imread, latest_frame_path)
-            if frame is None:
-                return {"status": "error", "error": "Failed to read frame from file"}
-            return {"status": "success", "frame": frame}
-        else:
-            return {"status": "error", "error": "No frames available yet"}
-    except Exception as e:
-        return {"status": "error", "error": f"WebRTC error: {str(e)}"}
-    
 agent_thread = None
 
 def start_agent(data=None):
@@ -132,6 +143,8 @@ def start_agent(data=None):
     def _run():
         webrtc_ready.wait()
         print("🔹 WebRTC ready, starting agent.")
+        # Convert at full width until the new agent has benchmarked and picked its own
+        write_analysis_width(None)
         cmd = [sys.executable, '-u', 'agent.py']
         print(f"⏳ Starting agent subprocess: {cmd}")
         proc = subprocess.Popen(
@@ -145,15 +158,17 @@ def start_agent(data=None):
             line = raw.rstrip()
             print(f"[agent] {line}")
             if(line.startswith("Starting") or line.startswith("Capturing") or line.startswith("✅ Body posture calibrated") or line.startswith("✅ Face angle calibrated") or line.startswith("❌")):
-                http_pusher.trigger('logs', 'new_log', {'message': line})
+                emit_log('new_log', line)
             elif(line.startswith("⚠️ Bad posture detected!")):
-                http_pusher.trigger('logs', 'bad_posture', {'message': line})
+                emit_log('bad_posture', line)
             elif(line.startswith("📱 Suspicious!")):
-                http_pusher.trigger('logs', 'phone_suspicion', {'message': line})
+                emit_log('phone_suspicion', line)
             elif(line.startswith("✅ You're no longer")):
-                http_pusher.trigger('logs', 'phone_suspicion', {'message': line})
+                emit_log('phone_suspicion', line)
             elif(line.startswith("✅ Posture corrected!")):
-                http_pusher.trigger('logs', 'bad_posture', {'message': line})
+                emit_log('bad_posture', line)
+            elif(line.startswith("⏱️ Sampling {")):
+                emit_sampling(line)
         proc.stdout.close()
         proc.wait()
         print(f"⚠️ Agent exited ({proc.returncode})")
@@ -168,6 +183,15 @@ def main():
             time.sleep(1)
     except KeyboardInterrupt:
         print("⏹️ Shutting down...")
+        # Closing peers ends their tracks, which removes recorders from the set
+        recorders = list(active_recorders)
+        try:
+            asyncio.run_coroutine_threadsafe(signaling.close_all(), loop).result(timeout=5)
+        except Exception as e:
+            # Still finalise recordings below; exiting now would cut off their writer threads
+            print(f"⚠️ Closing peers failed or timed out: {e!r}")
+        for recorder in recorders:
+            recorder.close()
         if agent_thread and agent_thread.is_alive():
             agent_thread.join()
 
@@ -0,0 +1,149 @@
+# session_recorder.py
+import os
+import json
+import time
+import queue
+import fractions
+import threading
+import av
+
+RECORD_SESSIONS = os.getenv("RECORD_SESSIONS", "0") == "1"
+RECORDINGS_DIR = os.getenv("RECORDINGS_DIR", "recordings")
+RECORD_QUEUE_FRAMES = int(os.getenv("RECORD_QUEUE_FRAMES", "60"))
+# Tried in order; PyAV builds without libx264 fall back to mpeg4
+RECORD_CODECS = ("libx264", "mpeg4")
+
+_TIME_BASE = fractions.Fraction(1, 1000)
+
+
+class SessionRecorder:
+    """Writes an incoming WebRTC video track to disk on a background thread.
+
+    ``submit`` and ``log_event`` never block: items go into a bounded queue
+    and are dropped (and counted) when the encoder falls behind. Video is
+    written to a Matroska file with millisecond timestamps taken from frame
+    arrival, and a JSONL sidecar records each frame's wall-clock time plus any
+    events emitted during the session.
+    """
+
+    def __init__(self, session_id, root=RECORDINGS_DIR, max_queue=RECORD_QUEUE_FRAMES, crf=28):
+        os.makedirs(root, exist_ok=True)
+        base = os.path.join(root, f"{time.strftime('%Y%m%d-%H%M%S')}-{session_id}")
+        self.video_path = base + ".mkv"
+        self.sidecar_path = base + ".jsonl"
+        self.crf = crf
+
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.events_dropped = 0
+        self.failed = False
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"recorder-{session_id}", daemon=True)
+        self._thread.start()
+
+    def submit(self, frame):
+        if self._closed:
+            return
+        try:
+            self._queue.put_nowait(("frame", frame, time.time()))
+        except queue.Full:
+            self.frames_dropped += 1
+
+    def log_event(self, name, data=None):
+        if self._closed:
+            return
+        try:
+            self._queue.put_nowait(("event", (name, data), time.time()))
+        except queue.Full:
+            self.events_dropped += 1
+
+    def close(self, timeout=10.0):
+        """Flush queued frames, finalise the container and wait for the writer thread.
+
+        Safe to call from several threads; every caller waits for the writer,
+        so shutdown can't exit while the file is still being finalised.
+        """
+        if not self._closed:
+            self._closed = True
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                print(f"⚠️ Recorder queue stuck; {self.video_path} may be incomplete")
+                return
+        self._thread.join(timeout)
+
+    def _open(self, frame):
+        container = av.open(self.video_path, mode="w", format="matroska")
+        for codec in RECORD_CODECS:
+            try:
+                stream = container.add_stream(codec, rate=30)
+                break
+            except Exception:
+                continue
+        else:
+            container.close()
+            raise RuntimeError("No usable video encoder")
+        stream.width = frame.width
+        stream.height = frame.height
+        stream.pix_fmt = "yuv420p"
+        stream.time_base = _TIME_BASE
+        stream.codec_context.time_base = _TIME_BASE
+        if stream.codec_context.name == "libx264":
+            stream.options = {"crf": str(self.crf), "preset": "veryfast"}
+        return container, stream
+
+    def _run(self):
+        container = stream = None
+        start_wall = None
+        last_pts = -1
+        with open(self.sidecar_path, "w") as sidecar:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                kind, payload, wall_time = item
+
+                if kind == "event":
+                    name, data = payload
+                    sidecar.write(json.dumps({"type": "event", "wall_time": wall_time, "name": name, "data": data}) + "\n")
+                    continue
+                if self.failed:
+                    continue
+
+                try:
+                    if container is None:
+                        container, stream = self._open(payload)
+                        start_wall = wall_time
+                    pts = max(int((wall_time - start_wall) * 1000), last_pts + 1)
+                    last_pts = pts
+
+                    frame = payload.reformat(width=stream.width, height=stream.height, format="yuv420p")
+                    frame.pts = pts
+                    frame.time_base = _TIME_BASE
+                    for packet in stream.encode(frame):
+                        container.mux(packet)
+
+                    sidecar.write(json.dumps({"type": "frame", "index": self.frames_written, "wall_time": wall_time, "pts_ms": pts}) + "\n")
+                    self.frames_written += 1
+                except Exception as e:
+                    print(f"❌ Recording failed for {self.video_path}: {e}")
+                    self.failed = True
+
+            sidecar.write(json.dumps({
+                "type": "summary",
+                "frames_written": self.frames_written,
+                "frames_dropped": self.frames_dropped,
+                "events_dropped": self.events_dropped,
+            }) + "\n")
+
+        if container is not None:
+            try:
+                if not self.failed:
+                    for packet in stream.encode():
+                        container.mux(packet)
+            finally:
+                container.close()
+        print(f"💾 Recorded {self.frames_written} frames to {self.video_path} ({self.frames_dropped} dropped)")
+
@@ -0,0 +1,166 @@
+# signaling.py
+import json
+import time
+from aiortc import RTCPeerConnection, RTCSessionDescription
+from aiortc.sdp import candidate_from_sdp
+
+# Offers and candidates from clients that predate session ids all share one session
+DEFAULT_SESSION_ID = "default"
+
+
+class PeerSession:
+    """One browser's peer connection plus the bookkeeping needed to set it up."""
+
+    def __init__(self, session_id, pc):
+        self.session_id = session_id
+        self.pc = pc
+        self.remote_description_set = False
+        self.pending_candidates = []
+        self.created_at = time.monotonic()
+        self.timings = {}
+
+    def mark(self, name):
+        """Record milliseconds from offer arrival to a setup milestone (first time only)."""
+        if name not in self.timings:
+            self.timings[name] = (time.monotonic() - self.created_at) * 1000
+            return True
+        return False
+
+
+class SignalingServer:
+    """Routes WebRTC offers and ICE candidates to per-session peer connections.
+
+    Candidates that arrive before their offer, or before the remote
+    description is applied, are buffered and replayed. Peers whose connection
+    fails or closes are torn down and forgotten. ``send_answer`` is an async
+    callable ``(session_id, description)``; ``on_track`` is called with
+    ``(session, track)`` for every incoming track.
+    """
+
+    def __init__(self, send_answer, on_track, early_candidate_ttl=30.0):
+        self.send_answer = send_answer
+        self.on_track = on_track
+        self.early_candidate_ttl = early_candidate_ttl
+        self.sessions = {}
+        self._early_candidates = {}
+
+    async def handle_offer(self, data):
+        offer = json.loads(data) if isinstance(data, str) else data
+        session_id = offer.get("sessionId") or DEFAULT_SESSION_ID
+
+        if session_id in self.sessions:
+            # A renegotiating client replaces its previous connection
+            await self.close_session(session_id)
+
+        pc = RTCPeerConnection()
+        session = PeerSession(session_id, pc)
+        self.sessions[session_id] = session
+        self._bind_events(session)
+
+        try:
+            await pc.setRemoteDescription(RTCSessionDescription(offer["sdp"], offer["type"]))
+            session.remote_description_set = True
+            session.pending_candidates.extend(c for _, c in self._early_candidates.pop(session_id, []))
+            await self._drain_candidates(session)
+
+            answer = await pc.createAnswer()
+            await pc.setLocalDescription(answer)
+            session.mark("answer_ms")
+            await self.send_answer(session_id, pc.localDescription)
+        except Exception as e:
+            # Offers arrive via run_coroutine_threadsafe, where nobody reads the exception
+            print(f"❌ Failed to set up peer {session_id}: {e}")
+            if self.sessions.get(session_id) is session:
+                await self.close_session(session_id)
+            else:
+                await pc.close()
+            return None
+        return session
+
+    async def handle_candidate(self, data):
+        try:
+            cand = json.loads(data) if isinstance(data, str) else data
+            session_id = cand.get("sessionId") or DEFAULT_SESSION_ID
+            ice = parse_candidate(cand)
+        except Exception as e:
+            # Like offers, candidates arrive via run_coroutine_threadsafe where nobody reads the exception
+            print(f"⚠️ Ignoring malformed ICE candidate: {e}")
+            return
+        if ice is None:
+            return
+
+        session = self.sessions.get(session_id)
+        if session is None:
+            self._prune_early_candidates()
+            self._early_candidates.setdefault(session_id, []).append((time.monotonic(), ice))
+        elif not session.remote_description_set:
+            session.pending_candidates.append(ice)
+        else:
+            await self._add_candidate(session, ice)
+
+    async def close_session(self, session_id):
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            return
+        try:
+            await session.pc.close()
+        except Exception as e:
+            print(f"⚠️ Error closing peer {session_id}: {e}")
+        print(f"🔌 Peer {session_id} closed")
+
+    async def close_all(self):
+        for session_id in list(self.sessions):
+            await self.close_session(session_id)
+
+    def stats(self):
+        return {session_id: dict(session.timings, state=session.pc.connectionState) for session_id, session in self.sessions.items()}
+
+    def _bind_events(self, session):
+        pc = session.pc
+
+        @pc.on("track")
+        def on_track(track):
+            self.on_track(session, track)
+
+        @pc.on("iceconnectionstatechange")
+        def on_ice_state():
+            if pc.iceConnectionState in ("connected", "completed") and session.mark("ice_connected_ms"):
+                print(f"📶 Peer {session.session_id}: ICE connected in {session.timings['ice_connected_ms']:.0f} ms")
+
+        @pc.on("connectionstatechange")
+        async def on_connection_state():
+            # Only drop the session if it hasn't already been replaced by a newer offer
+            if pc.connectionState in ("failed", "closed") and self.sessions.get(session.session_id) is session:
+                await self.close_session(session.session_id)
+
+    async def _drain_candidates(self, session):
+        pending, session.pending_candidates = session.pending_candidates, []
+        for ice in pending:
+            await self._add_candidate(session, ice)
+
+    async def _add_candidate(self, session, ice):
+        try:
+            await session.pc.addIceCandidate(ice)
+        except Exception as e:
+            print(f"⚠️ Failed to add ICE candidate for {session.session_id}: {e}")
+
+    def _prune_early_candidates(self):
+        cutoff = time.monotonic() - self.early_candidate_ttl
+        for session_id in list(self._early_candidates):
+            fresh = [(t, c) for t, c in self._early_candidates[session_id] if t >= cutoff]
+            if fresh:
+                self._early_candidates[session_id] = fresh
+            else:
+                del self._early_candidates[session_id]
+
+
+def parse_candidate(cand):
+    """Build an aiortc candidate from a browser ``RTCIceCandidateInit`` dict."""
+    sdp = cand.get("candidate")
+    if not sdp:
+        # End-of-candidates marker
+        return None
+    ice = candidate_from_sdp(sdp.split(":", 1)[1] if sdp.startswith("candidate:") else sdp)
+    ice.sdpMid = cand.get("sdpMid")
+    ice.sdpMLineIndex = cand.get("sdpMLineIndex")
+    return ice
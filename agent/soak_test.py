@@ -0,0 +1,286 @@
+# soak_test.py
+"""Long-duration soak test for the monitoring pipeline.
+
+Replays frames through the full agent path (FrameReceiver hand-off, pose
+checks, monitoring stages, metrics store) back to back, so hours of simulated
+session time run in minutes. Along the way it samples RSS, tracemalloc's
+top growing allocators, object counts by type and p99 tick latency, and exits
+non-zero when memory growth or latency drift passes the configured limits.
+
+With --peer-cycle-minutes, local WebRTC peers are also connected through
+SignalingServer and hung up again on a schedule, so the session map and
+receive loops are sampled for growth alongside the monitoring path.
+
+The video must show a person: without detected landmarks the checks return
+early and most of the pipeline never runs, so the run also fails when no
+tick produced a posture or face result.
+
+Usage:
+    python soak_test.py --hours 4 --video recordings/session.mkv
+    python soak_test.py --hours 8 --video recordings/session.mkv --max-rss-growth-mb-per-hour 10
+    python soak_test.py --hours 4 --video recordings/session.mkv --peer-cycle-minutes 5
+
+Stage pacing and deadlines from the supervisor are bypassed to run
+accelerated, and Gemini escalations are answered locally unless
+--allow-network is given.
+"""
+import os
+import gc
+import sys
+import json
+import time
+import argparse
+import asyncio
+import tempfile
+import tracemalloc
+from collections import Counter
+import numpy as np
+import av
+av.logging.set_level(av.logging.ERROR)
+
+import agent
+import posture_tools
+from agent import PostureState, MONITOR_INTERVAL, build_monitoring_stages
+from frame_receiver import FrameReceiver, FRAMES_DIR, webrtc_status_path
+from metrics_store import MetricsStore
+from sampling_governor import SamplingGovernor
+from load_test import LoadHarness, load_video_frames, read_rss_mb
+
+
+def count_objects(limit=None):
+    counts = Counter(type(obj).__name__ for obj in gc.get_objects())
+    return dict(counts.most_common(limit))
+
+
+async def offline_escalation(image_base64):
+    return "no"
+
+
+class SoakRun:
+    def __init__(self, args):
+        self.args = args
+        self.samples = []
+        self.window_ms = []
+        self.baseline_snapshot = None
+        self.baseline_objects = None
+        self.harness = None
+        self.peer_cycles = 0
+
+    async def setup(self):
+        images = load_video_frames(self.args.video, self.args.width, self.args.height, limit=self.args.max_frames)
+        self.frames = [av.VideoFrame.from_ndarray(img, format="rgb24") for img in images]
+
+        os.makedirs(FRAMES_DIR, exist_ok=True)
+        with open(webrtc_status_path, "w") as f:
+            f.write("ready")
+        # Publish every tick; decimation is driven by the simulated clock instead
+        self.receiver = FrameReceiver(analysis_fps=0)
+        self.receiver.publish(self.frames[0])
+
+        if not self.args.allow_network:
+            agent.ask_gemini_if_looking_at_phone = offline_escalation
+
+        self.state = PostureState(camera_working=True)
+        await self._calibrate()
+        self.state.metrics_store = MetricsStore(root="metrics", flush_interval=float("inf"))
+        # Updated every tick so its observe/ramp paths run, though pacing stays accelerated
+        self.state.governor = SamplingGovernor()
+        self.stages = build_monitoring_stages(self.state)
+
+        if self.args.peer_cycle_minutes:
+            # Peers stream the generated pattern; only their setup and teardown matter here
+            self.harness = LoadHarness(argparse.Namespace(
+                video=None, width=self.args.width, height=self.args.height, fps=15,
+                analyse=False, analysis_fps=2.0, max_frames=0,
+            ), os.getcwd())
+
+    async def _calibrate(self):
+        posture = await posture_tools.calibrate_posture_tool()
+        face = await posture_tools.calibrate_face_angle_tool()
+        if posture["status"] != "success":
+            print("⚠️ No pose in replayed frames; using a fixed posture baseline.")
+            posture_tools.calibrated_features = np.full(15, 0.5)
+        if face["status"] != "success":
+            print("⚠️ No face in replayed frames; using a fixed face angle baseline.")
+            posture_tools.calibrated_face_angle = {
+                "vertical_angle": 0.0,
+                "horizontal_angle": 0.0,
+                "tolerance_vertical": 15.0,
+                "tolerance_horizontal": 20.0,
+            }
+        self.state.posture_calibrated = True
+        self.state.face_angle_calibrated = True
+
+    async def run(self):
+        ticks = int(self.args.hours * 3600 / MONITOR_INTERVAL)
+        ticks_per_sample = max(1, int(self.args.sample_minutes * 60 / MONITOR_INTERVAL))
+        ticks_per_cycle = max(1, int(self.args.peer_cycle_minutes * 60 / MONITOR_INTERVAL)) if self.harness else None
+        warmup_ticks = int(self.args.warmup_minutes * 60 / MONITOR_INTERVAL)
+
+        if self.args.tracemalloc:
+            tracemalloc.start(10)
+        print(f"🏃 Soaking {self.args.hours:.1f} h of simulated time ({ticks} ticks)...")
+        print(f"{'sim h':>6} {'wall s':>7} {'rss MB':>7} {'traced MB':>9} {'objects':>9} {'p99 ms':>7} {'peers':>5}")
+        wall_start = time.monotonic()
+
+        for tick in range(ticks):
+            await asyncio.to_thread(self.receiver.publish, self.frames[tick % len(self.frames)])
+            started = time.perf_counter()
+            for step in self.stages.values():
+                await step()
+            self.state.governor.update()
+            self.window_ms.append((time.perf_counter() - started) * 1000)
+
+            if ticks_per_cycle and (tick + 1) % ticks_per_cycle == 0:
+                await self._cycle_peer()
+
+            if tick + 1 == warmup_ticks or (warmup_ticks == 0 and tick == 0):
+                gc.collect()
+                self.baseline_objects = count_objects()
+                if self.args.tracemalloc:
+                    self.baseline_snapshot = tracemalloc.take_snapshot()
+            if (tick + 1) % ticks_per_sample == 0:
+                self._sample((tick + 1) * MONITOR_INTERVAL / 3600, time.monotonic() - wall_start, tick + 1 > warmup_ticks)
+
+        self.state.metrics_store.close()
+        if self.harness:
+            await self.harness.close()
+        return self._evaluate()
+
+    async def _cycle_peer(self):
+        index = self.peer_cycles
+        self.peer_cycles += 1
+        try:
+            await self.harness.add_peer(index)
+            await asyncio.sleep(self.args.peer_seconds)
+        except Exception as e:
+            print(f"⚠️ Peer cycle {index} failed: {e}")
+        await self.harness.remove_peer(index)
+
+    def _sample(self, sim_hours, wall_s, after_warmup):
+        gc.collect()
+        sample = {
+            "sim_hours": sim_hours,
+            "wall_s": wall_s,
+            "rss_mb": read_rss_mb(),
+            "traced_mb": tracemalloc.get_traced_memory()[0] / 2**20 if self.args.tracemalloc else None,
+            "objects": len(gc.get_objects()),
+            "p99_ms": float(np.percentile(self.window_ms, 99)),
+            "sessions": len(self.harness.signaling.sessions) if self.harness else None,
+            "after_warmup": after_warmup,
+        }
+        self.window_ms = []
+        self.samples.append(sample)
+        traced = "-" if sample["traced_mb"] is None else f"{sample['traced_mb']:.1f}"
+        sessions = "-" if sample["sessions"] is None else sample["sessions"]
+        print(f"{sim_hours:>6.2f} {wall_s:>7.0f} {sample['rss_mb']:>7.1f} {traced:>9} {sample['objects']:>9} {sample['p99_ms']:>7.1f} {sessions:>5}")
+
+    def _evaluate(self):
+        samples = [s for s in self.samples if s["after_warmup"]]
+        report = {"samples": self.samples, "failures": []}
+
+        # Checks only produce these columns when landmarks were found
+        produced = self.state.metrics_store.query(columns=["deviation", "vertical_angle"])
+        report["posture_results"] = int((~np.isnan(produced["deviation"])).sum())
+        report["face_results"] = int((~np.isnan(produced["vertical_angle"])).sum())
+        if not report["posture_results"]:
+            report["failures"].append("no tick produced a posture result; replay a video with a person in frame")
+        if not report["face_results"]:
+            report["failures"].append("no tick produced a face angle result; replay a video with a face in frame")
+
+        if self.harness:
+            report["peer_cycles"] = self.peer_cycles
+            leaked = max(s["sessions"] for s in self.samples) if self.samples else 0
+            if leaked:
+                report["failures"].append(f"{leaked} peer session(s) still registered after hang-up")
+
+        if len(samples) < 2:
+            report["failures"].append("not enough samples after warmup; increase --hours or lower --sample-minutes")
+            return report
+
+        hours = np.array([s["sim_hours"] for s in samples])
+        report["rss_growth_mb_per_hour"] = float(np.polyfit(hours, [s["rss_mb"] for s in samples], 1)[0])
+        if self.args.tracemalloc:
+            report["traced_growth_mb_per_hour"] = float(np.polyfit(hours, [s["traced_mb"] for s in samples], 1)[0])
+        edge = max(1, len(samples) // 4)
+        first_p99 = np.mean([s["p99_ms"] for s in samples[:edge]])
+        last_p99 = np.mean([s["p99_ms"] for s in samples[-edge:]])
+        report["p99_drift"] = float(last_p99 / first_p99) if first_p99 > 0 else None
+
+        if report["rss_growth_mb_per_hour"] > self.args.max_rss_growth_mb_per_hour:
+            report["failures"].append(f"RSS grew {report['rss_growth_mb_per_hour']:.1f} MB/h (limit {self.args.max_rss_growth_mb_per_hour})")
+        if report["p99_drift"] is not None and report["p99_drift"] > self.args.max_p99_drift:
+            report["failures"].append(f"p99 tick latency drifted x{report['p99_drift']:.2f} (limit x{self.args.max_p99_drift})")
+
+        if self.baseline_objects is not None:
+            current = count_objects()
+            growth = {name: count - self.baseline_objects.get(name, 0) for name, count in current.items()}
+            report["object_growth"] = dict(sorted(growth.items(), key=lambda item: -item[1])[:10])
+        if self.baseline_snapshot is not None:
+            stats = tracemalloc.take_snapshot().compare_to(self.baseline_snapshot, "lineno")
+            report["top_allocators"] = [
+                {"where": str(stat.traceback[0]), "size_diff_kb": stat.size_diff / 1024, "count_diff": stat.count_diff}
+                for stat in stats[:self.args.top_allocators]
+            ]
+        return report
+
+
+def print_report(report):
+    print("\n📊 Soak summary:")
+    for key in ("posture_results", "face_results", "peer_cycles"):
+        if key in report:
+            print(f"   - {key}: {report[key]}")
+    for key in ("rss_growth_mb_per_hour", "traced_growth_mb_per_hour", "p99_drift"):
+        if report.get(key) is not None:
+            print(f"   - {key}: {report[key]:.2f}")
+    for name, growth in report.get("object_growth", {}).items():
+        print(f"   - objects {name}: {growth:+d}")
+    for stat in report.get("top_allocators", []):
+        print(f"   - {stat['where']}: {stat['size_diff_kb']:+.1f} KiB ({stat['count_diff']:+d} blocks)")
+    if report["failures"]:
+        for failure in report["failures"]:
+            print(f"❌ {failure}")
+    else:
+        print("✅ No memory growth or latency drift beyond limits.")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Soak the monitoring pipeline with replayed frames at accelerated speed.")
+    parser.add_argument("--hours", type=float, default=4.0, help="simulated session length")
+    parser.add_argument("--sample-minutes", type=float, default=10.0, help="simulated time between samples")
+    parser.add_argument("--warmup-minutes", type=float, default=10.0, help="simulated time excluded from growth checks")
+    parser.add_argument("--video", required=True, help="replay frames from this video file; it must show a person")
+    parser.add_argument("--max-frames", type=int, default=600, help="frames to load from --video")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--max-rss-growth-mb-per-hour", type=float, default=20.0)
+    parser.add_argument("--max-p99-drift", type=float, default=1.5, help="allowed ratio of late to early p99 tick latency")
+    parser.add_argument("--no-tracemalloc", dest="tracemalloc", action="store_false", help="skip tracemalloc (faster)")
+    parser.add_argument("--top-allocators", type=int, default=10)
+    parser.add_argument("--peer-cycle-minutes", type=float, default=0.0, help="connect and hang up a WebRTC peer this often (simulated time); 0 disables")
+    parser.add_argument("--peer-seconds", type=float, default=2.0, help="wall time each cycled peer streams before hanging up")
+    parser.add_argument("--allow-network", action="store_true", help="send escalations to Gemini instead of answering locally")
+    parser.add_argument("--json", help="write the report to this file")
+    return parser.parse_args(argv)
+
+
+async def main(args):
+    # Frames, calibration and metrics all use relative paths; keep them out of the checkout
+    args.video = os.path.abspath(args.video)
+    if args.json:
+        args.json = os.path.abspath(args.json)
+    with tempfile.TemporaryDirectory(prefix="soak_") as workdir:
+        os.chdir(workdir)
+        soak = SoakRun(args)
+        await soak.setup()
+        report = await soak.run()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if report["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
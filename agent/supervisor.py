@@ -0,0 +1,176 @@
+# supervisor.py
+import asyncio
+import time
+from collections import deque
+import numpy as np
+
+
+class TickSkipped(Exception):
+    """Raised by a stage step that cannot run this tick; counted as an overrun."""
+
+
+class Stage:
+    """A periodic monitoring step with a latency deadline."""
+
+    def __init__(self, name, step, interval, deadline, stall_timeout=None):
+        self.name = name
+        self.step = step
+        self.interval = interval
+        self.deadline = deadline
+        self._stall_timeout = stall_timeout
+
+        self.task = None
+        self.heartbeat = time.monotonic()
+        self.runs = 0
+        self.overruns = 0
+        self.failures = 0
+        self.restarts = 0
+        self.latencies_ms = deque(maxlen=512)
+        self._wake = asyncio.Event()
+
+    @property
+    def stall_timeout(self):
+        # Follows the current interval so a backed-off stage isn't mistaken for a stalled one
+        return self._stall_timeout or (self.deadline + self.interval) * 2
+
+    async def wait(self, delay):
+        """Sleep until the next tick, or until woken by a shorter interval."""
+        self._wake.clear()
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+    def stats(self):
+        latencies = np.asarray(self.latencies_ms) if self.latencies_ms else None
+        return {
+            "interval_s": self.interval,
+            "deadline_s": self.deadline,
+            "runs": self.runs,
+            "overruns": self.overruns,
+            "failures": self.failures,
+            "restarts": self.restarts,
+            "p50_ms": float(np.percentile(latencies, 50)) if latencies is not None else None,
+            "p99_ms": float(np.percentile(latencies, 99)) if latencies is not None else None,
+            "max_ms": float(latencies.max()) if latencies is not None else None,
+        }
+
+
+class StageSupervisor:
+    """Runs monitoring stages as independent tasks with deadlines and a watchdog.
+
+    Each tick of a stage is bounded by its deadline: an overrunning tick is
+    cancelled, counted and skipped so one slow step cannot stretch the loop.
+    Cancelling cannot stop work already handed to a thread, so steps whose
+    earlier work is still running raise ``TickSkipped`` instead of queueing
+    more; those ticks count as overruns too.
+    The watchdog restarts stages whose task died or whose heartbeat stalled,
+    and reports event-loop blocking (which no deadline can preempt).
+    ``context`` holds whatever object the stages operate on, so callers can
+    read live state while the stages run.
+    """
+
+    def __init__(self, watchdog_interval=1.0, context=None):
+        self.watchdog_interval = watchdog_interval
+        self.context = context
+        self.stages = {}
+        self.loop_lag_max_ms = 0.0
+        self._watchdog_task = None
+        self._running = False
+
+    def add_stage(self, name, step, interval, deadline, stall_timeout=None):
+        if name in self.stages:
+            raise ValueError(f"Stage '{name}' already registered")
+        stage = Stage(name, step, interval, deadline, stall_timeout)
+        self.stages[name] = stage
+        if self._running:
+            self._spawn(stage)
+        return stage
+
+    def set_interval(self, name, interval):
+        """Change a stage's tick interval. Shortening it wakes a sleeping stage at once."""
+        stage = self.stages[name]
+        if interval < stage.interval:
+            stage._wake.set()
+        stage.interval = interval
+
+    def start(self):
+        self._running = True
+        for stage in self.stages.values():
+            self._spawn(stage)
+        self._watchdog_task = asyncio.create_task(self._watchdog(), name="stage-watchdog")
+
+    async def stop(self, timeout=2.0):
+        """Cancel all stages and the watchdog and wait for them to unwind."""
+        self._running = False
+        tasks = [stage.task for stage in self.stages.values() if stage.task]
+        if self._watchdog_task:
+            tasks.append(self._watchdog_task)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            done, pending = await asyncio.wait(tasks, timeout=timeout)
+            for task in pending:
+                print(f"⚠️ Task {task.get_name()} did not stop within {timeout}s")
+
+    def stats(self):
+        result = {name: stage.stats() for name, stage in self.stages.items()}
+        result["loop_lag_max_ms"] = self.loop_lag_max_ms
+        return result
+
+    def _spawn(self, stage):
+        stage.heartbeat = time.monotonic()
+        stage.task = asyncio.create_task(self._run_stage(stage), name=f"stage-{stage.name}")
+
+    async def _run_stage(self, stage):
+        while True:
+            started = time.monotonic()
+            stage.heartbeat = started
+            try:
+                await asyncio.wait_for(stage.step(), timeout=stage.deadline)
+            except asyncio.TimeoutError:
+                stage.overruns += 1
+                print(f"⏱️ {stage.name} overran its {stage.deadline:.1f}s deadline, skipping tick")
+            except TickSkipped as e:
+                stage.overruns += 1
+                print(f"⏱️ {stage.name} skipping tick: {str(e)}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                stage.failures += 1
+                print(f"❌ {stage.name} stage error: {str(e)}")
+
+            elapsed = time.monotonic() - started
+            stage.runs += 1
+            stage.latencies_ms.append(elapsed * 1000)
+            stage.heartbeat = time.monotonic()
+            await stage.wait(max(0.0, stage.interval - elapsed))
+
+    async def _watchdog(self):
+        expected = time.monotonic() + self.watchdog_interval
+        while True:
+            await asyncio.sleep(self.watchdog_interval)
+            now = time.monotonic()
+            lag = now - expected
+            expected = now + self.watchdog_interval
+            self.loop_lag_max_ms = max(self.loop_lag_max_ms, lag * 1000)
+
+            for stage in self.stages.values():
+                if stage.task is None:
+                    continue
+                if stage.task.done():
+                    error = None if stage.task.cancelled() else stage.task.exception()
+                    print(f"🔁 Restarting {stage.name} stage (exited: {error})")
+                elif now - stage.heartbeat > stage.stall_timeout:
+                    if lag > stage.stall_timeout:
+                        # The whole loop was blocked; the stage itself is not stuck
+                        continue
+                    print(f"🔁 Restarting {stage.name} stage (no progress for {now - stage.heartbeat:.1f}s)")
+                    stage.task.cancel()
+                else:
+                    continue
+                stage.restarts += 1
+                self._spawn(stage)
+
+            if lag > self.watchdog_interval:
+                print(f"⚠️ Event loop blocked for {lag:.1f}s")
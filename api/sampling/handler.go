@@ -0,0 +1,58 @@
+package sampling
+
+import (
+	"encoding/json"
+	"net/http"
+	"os"
+
+	"github.com/pusher/pusher-http-go"
+)
+
+var pusherClient = pusher.Client{
+	AppID:   os.Getenv("PUSHER_APP_ID"),
+	Key:     os.Getenv("PUSHER_APP_KEY"),
+	Secret:  os.Getenv("PUSHER_APP_SECRET"),
+	Cluster: os.Getenv("PUSHER_APP_CLUSTER"),
+	Secure:  true,
+}
+
+// Control adjusts the agent's analysis rate. An empty body just asks for the current rate.
+// Numeric fields are pointers so an explicit zero (cpuBudget 0 disables the budget) is
+// forwarded rather than dropped as unset.
+type Control struct {
+	Mode        string   `json:"mode,omitempty"`
+	Interval    *float64 `json:"interval,omitempty"`
+	CPUBudget   *float64 `json:"cpuBudget,omitempty"`
+	MinInterval *float64 `json:"minInterval,omitempty"`
+	MaxInterval *float64 `json:"maxInterval,omitempty"`
+}
+
+type Response struct {
+	Status string `json:"status"`
+	Error  string `json:"error,omitempty"`
+}
+
+func Handler(w http.ResponseWriter, r *http.Request) {
+	if r.Method != http.MethodPost {
+		http.Error(w, "Method Not Allowed", http.StatusMethodNotAllowed)
+		return
+	}
+
+	var control Control
+	if r.ContentLength != 0 {
+		if err := json.NewDecoder(r.Body).Decode(&control); err != nil {
+			http.Error(w, "Bad Request", http.StatusBadRequest)
+			return
+		}
+	}
+
+	err := pusherClient.Trigger("control", "sampling", control)
+	if err != nil {
+		w.WriteHeader(http.StatusInternalServerError)
+		json.NewEncoder(w).Encode(Response{Status: "error", Error: err.Error()})
+		return
+	}
+
+	w.Header().Set("Content-Type", "application/json")
+	json.NewEncoder(w).Encode(Response{Status: "ok"})
+}
@@ -20,6 +20,7 @@ type Candidate struct {
 	Candidate     string `json:"candidate"`
 	SDPMid        string `json:"sdpMid"`
 	SDPMLineIndex int    `json:"sdpMLineIndex"`
+	SessionID     string `json:"sessionId,omitempty"`
 }
 
 type Response struct {
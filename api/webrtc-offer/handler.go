@@ -17,8 +17,9 @@ var pusherClient = pusher.Client{
 }
 
 type Offer struct {
-	SDP  string `json:"sdp"`
-	Type string `json:"type"`
+	SDP       string `json:"sdp"`
+	Type      string `json:"type"`
+	SessionID string `json:"sessionId,omitempty"`
 }
 
 type Response struct {
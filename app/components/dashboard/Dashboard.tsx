@@ -23,6 +23,7 @@ export default function Dashboard() {
   
   const signallingChannel = useRef<any>(null);
   const pcRef = useRef<RTCPeerConnection | null>(null);
+  const sessionIdRef = useRef<string | null>(null);
 
   useEffect(() => {
     (async () => {
@@ -100,6 +101,7 @@ export default function Dashboard() {
     signallingChannel.current.bind('answer', (data: any) => {
       const pc = pcRef.current;
       if (!pc) return;
+      if (data?.sessionId && data.sessionId !== sessionIdRef.current) return;
       const desc = new RTCSessionDescription(data);
       pc.setRemoteDescription(desc)
       .then(() => {
@@ -112,6 +114,8 @@ export default function Dashboard() {
       .catch(console.error);
     });
     signallingChannel.current.bind('candidate', (data: any) => {
+      // Session-tagged candidates come from browsers and are meant for the agent
+      if (data?.sessionId) return;
       const candInit: RTCIceCandidateInit = {
         candidate: data.candidate,
         sdpMid: data.sdpMid,
@@ -141,7 +145,9 @@ export default function Dashboard() {
   useEffect(() => {
     if (!cameraStream || !isMonitoring) return;
     const pc = new RTCPeerConnection();
+    const sessionId = crypto.randomUUID();
     pcRef.current = pc;
+    sessionIdRef.current = sessionId;
     
     cameraStream.getTracks().forEach(track => pc.addTrack(track, cameraStream));
     
@@ -152,7 +158,8 @@ export default function Dashboard() {
         body: JSON.stringify({
           candidate: event.candidate.candidate,
           sdpMid: event.candidate.sdpMid,
-          sdpMLineIndex: event.candidate.sdpMLineIndex
+          sdpMLineIndex: event.candidate.sdpMLineIndex,
+          sessionId
         })
       }).catch(console.error);
     };
@@ -163,12 +170,12 @@ export default function Dashboard() {
       if (pc.localDescription) fetch('/api/webrtc-offer/handler', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ sdp: pc.localDescription.sdp, type: pc.localDescription.type })
+        body: JSON.stringify({ sdp: pc.localDescription.sdp, type: pc.localDescription.type, sessionId })
       }).catch(console.error);
     })
     .catch(console.error);
     
-    return () => { pc.close(); pcRef.current = null; };
+    return () => { pc.close(); pcRef.current = null; sessionIdRef.current = null; };
   }, [cameraStream, isMonitoring]);
   
   const startAgent = async () => {